@@ -0,0 +1,6 @@
+"""
+Serverless Functions 共享的内部模块
+
+以下划线开头的目录不会被 Vercel 部署为独立的 API 路由，
+这里只放各个 handler 之间复用的代码。
+"""
@@ -0,0 +1,250 @@
+"""
+单应用模式：用一个 ASGI 应用承载所有 API 接口
+
+默认部署中每个 handler 文件是一个独立的 Serverless Function，各自冷启动、各自持有 Supabase 客户端和缓存，
+访问量小的 auth / admin 接口几乎每次都是冷启动。单应用模式下所有路由运行在同一个进程中，
+共享 db.py 的客户端与连接池、各接口的 TTLCache 等热状态。
+
+现有的 BaseHTTPRequestHandler 类原样复用：每个请求在线程池中运行对应的 handler，
+请求和响应通过内存中的 socket 转换，响应体边写边转发（SSE、chunked 流式输出都可用）。
+长时间占用线程的接口（SSE、批量创建用户）使用单独的有界线程池，占满时直接返回 503，
+不会挤占登录、心跳等普通请求的线程。
+handler 模块在路由第一次被访问时才导入，不影响冷启动。
+
+    uvicorn api.app:app --port 3001      # 本地开发 / 压测
+"""
+import asyncio
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import threading
+
+from api._lib.reqlog import current_log
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (路径正则, handler 文件)：按顺序匹配，第一个命中的生效
+ROUTES = [
+    (r"/api/posts", "posts.py"),
+    (r"/api/posts/search", "posts/search.py"),
+    (r"/api/posts/stream", "posts/stream.py"),
+    (r"/api/posts/[^/]+", "posts/[id].py"),
+    (r"/api/webhook", "webhook.py"),
+    (r"/api/auth/login", "auth/login.py"),
+    (r"/api/auth/logout", "auth/logout.py"),
+    (r"/api/auth/heartbeat", "auth/heartbeat.py"),
+    (r"/api/auth/change-password", "auth/change-password.py"),
+    (r"/api/admin/create-user", "admin/create-user.py"),
+    (r"/api/admin/reset-password", "admin/reset-password.py"),
+]
+
+# 长时间占用线程的 handler：SSE 每个连接持续约 25 秒，批量创建用户逐行输出结果
+LONG_LIVED_ROUTES = frozenset({"posts/stream.py", "admin/create-user.py"})
+
+# 线程池大小：普通请求、长时间占用线程的请求（占满时返回 503）
+ASGI_WORKERS = int(os.environ.get("ASGI_WORKERS", "32"))
+ASGI_STREAM_WORKERS = int(os.environ.get("ASGI_STREAM_WORKERS", "16"))
+
+# 由 ASGI 服务器负责的响应头：handler 写出的版本会被丢弃，避免重复或与实际传输方式冲突
+HOP_BY_HOP_HEADERS = frozenset({b"connection", b"transfer-encoding", b"keep-alive", b"server", b"date"})
+
+_compiled_routes = [(re.compile(pattern + r"/?$"), path) for pattern, path in ROUTES]
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="asgi")
+_stream_executor = ThreadPoolExecutor(max_workers=ASGI_STREAM_WORKERS, thread_name_prefix="asgi-stream")
+# 线程池本身的队列没有上限，这里限制同时运行的长连接数，超出时不排队
+_stream_slots = threading.BoundedSemaphore(ASGI_STREAM_WORKERS)
+
+
+def resolve(path):
+    """按请求路径找到 handler 文件，没有匹配时返回 None"""
+    for pattern, handler_path in _compiled_routes:
+        if pattern.match(path):
+            return handler_path
+    return None
+
+
+def load_handler(handler_path):
+    """导入 handler 文件并返回其中的 handler 类（每个文件只导入一次）"""
+    handler_class = _handlers.get(handler_path)
+    if handler_class is not None:
+        return handler_class
+
+    with _handlers_lock:
+        handler_class = _handlers.get(handler_path)
+        if handler_class is None:
+            name = "api_route_" + re.sub(r"\W", "_", handler_path[:-3])
+            spec = importlib.util.spec_from_file_location(name, os.path.join(API_ROOT, handler_path))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            handler_class = _handlers[handler_path] = module.handler
+    return handler_class
+
+
+class BridgeSocket:
+    """
+    交给 BaseHTTPRequestHandler 的内存 socket：
+    读取端是拼好的 HTTP 请求，写入端把数据转交给事件循环
+    """
+
+    def __init__(self, request_bytes, loop, queue):
+        self.rfile = io.BytesIO(request_bytes)
+        self.loop = loop
+        self.queue = queue
+        self.disconnected = False
+
+    def makefile(self, mode, *args, **kwargs):
+        return self.rfile
+
+    def sendall(self, data):
+        if self.disconnected:
+            raise BrokenPipeError("client disconnected")
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, bytes(data))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+
+def build_request(scope, body):
+    """
+    把 ASGI 请求还原为 HTTP 请求字节
+    使用 HTTP/1.0：handler 处理完一个请求即结束，流式响应直接写出原始数据（不做 chunked 编码）
+    """
+    target = scope.get("raw_path") or scope["path"].encode()
+    if scope.get("query_string"):
+        target += b"?" + scope["query_string"]
+    lines = [scope["method"].encode() + b" " + target + b" HTTP/1.0"]
+    for name, value in scope["headers"]:
+        if name.lower() not in (b"content-length", b"transfer-encoding"):
+            lines.append(name + b": " + value)
+    lines.append(b"Content-Length: " + str(len(body)).encode())
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body
+
+
+def parse_response_head(head):
+    """解析 handler 写出的状态行和响应头，返回 (status, headers)"""
+    status_line, *header_lines = head.split(b"\r\n")
+    status = int(status_line.split(b" ", 2)[1])
+    headers = []
+    for line in header_lines:
+        name, _, value = line.partition(b":")
+        if name and name.strip().lower() not in HOP_BY_HOP_HEADERS:
+            headers.append((name.strip().lower(), value.strip()))
+    return status, headers
+
+
+async def read_body(receive):
+    """读取完整的请求体；客户端提前断开时返回 None"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def watch_disconnect(receive, sock):
+    """请求体读完后继续监听断开事件，通知仍在写响应的 handler（如 SSE）停止"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            sock.disconnected = True
+            return
+
+
+async def send_text(send, status, text, headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json; charset=utf-8"), *headers]})
+    await send({"type": "http.response.body", "body": text.encode()})
+
+
+async def handle_http(scope, receive, send):
+    handler_path = resolve(scope["path"])
+    if handler_path is None:
+        await send_text(send, 404, '{"success": false, "error": "Not found"}')
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    long_lived = handler_path in LONG_LIVED_ROUTES
+    if long_lived and not _stream_slots.acquire(blocking=False):
+        current_log().error("asgi_stream_rejected", handler=handler_path)
+        await send_text(send, 503, '{"success": false, "error": "Server busy"}', [(b"retry-after", b"5")])
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sock = BridgeSocket(build_request(scope, body), loop, queue)
+    client_address = tuple(scope.get("client") or ("127.0.0.1", 0))
+
+    def run():
+        try:
+            load_handler(handler_path)(sock, client_address, None)
+        except Exception as e:
+            current_log().error("asgi_handler_failed", handler=handler_path, error=str(e))
+        finally:
+            sock.close()
+            if long_lived:
+                _stream_slots.release()
+
+    worker = loop.run_in_executor(_stream_executor if long_lived else _executor, run)
+    watcher = asyncio.ensure_future(watch_disconnect(receive, sock))
+    try:
+        await relay_response(queue, send)
+    finally:
+        watcher.cancel()
+        await worker
+
+
+async def relay_response(queue, send):
+    """把 handler 写出的字节转换为 ASGI 响应：先解析响应头，其余数据按写入顺序转发"""
+    buffer = b""
+    started = False
+    while True:
+        data = await queue.get()
+        if data is None:
+            break
+        if started:
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+            continue
+
+        buffer += data
+        head, separator, rest = buffer.partition(b"\r\n\r\n")
+        if not separator:
+            continue
+        status, headers = parse_response_head(head)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        started = True
+        if rest:
+            await send({"type": "http.response.body", "body": rest, "more_body": True})
+
+    if not started:
+        await send_text(send, 500, '{"success": false, "error": "Internal server error"}')
+        return
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI 入口：按路径分发到对应的 handler"""
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+    elif scope["type"] == "http":
+        await handle_http(scope, receive, send)
@@ -0,0 +1,173 @@
+"""
+实例内的帖子变更广播（SSE 推送使用）
+
+同一个函数实例上无论连接了多少个客户端，都只有一个后台线程轮询数据库，
+查询到的变更以事件形式分发到每个订阅者的队列，上游查询代价与在线人数无关。
+"""
+from collections import deque
+import logging
+import queue
+import threading
+import time
+
+from api._lib.feed import decode_cursor, encode_position, encode_watermark, public_post, tombstone_reason
+
+logger = logging.getLogger(__name__)
+
+
+def row_to_event(row):
+    """
+    把一行变更转换为 (event_id, event_type, data)
+    event_id 就是该行的增量水位线，客户端断线重连时通过 Last-Event-ID 带回
+    """
+    reason = tombstone_reason(row)
+    if reason:
+        return encode_watermark(row), "tombstone", {"id": row["id"], "reason": reason}
+    return encode_watermark(row), "post", public_post(row)
+
+
+def event_position(event_id):
+    """事件 id -> 可比较的 (updated_at, id)；无法解析时返回 None"""
+    try:
+        return decode_cursor(event_id)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class FeedBroadcaster:
+    """
+    轮询一次，分发给所有订阅者
+
+    - fetch_changes(since_position) -> (rows, has_more)，rows 按 (updated_at, id) 升序
+    - fetch_latest() -> 当前最新水位线，首次启动时作为起点
+    - 最近的事件保存在环形缓冲区中，用于断线重连时补发
+    - 没有订阅者超过 idle_timeout 秒后，轮询线程自动退出
+    """
+
+    def __init__(self, fetch_changes, fetch_latest, poll_interval=3.0, backlog_size=256,
+                 queue_size=512, idle_timeout=30.0):
+        self.fetch_changes = fetch_changes
+        self.fetch_latest = fetch_latest
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._backlog = deque(maxlen=backlog_size)
+        self._watermark = None
+        self._thread = None
+        self._idle_since = None
+        self._stats = {"polls": 0, "poll_errors": 0, "events": 0, "dropped_subscribers": 0}
+
+    def subscribe(self, last_event_id=None):
+        """
+        注册一个订阅者，返回 (queue, replay)
+        replay 为缓冲区中 last_event_id 之后的事件列表；
+        last_event_id 不在缓冲区中时 replay 为 None，由调用方自行补查
+        """
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            replay = []
+            if last_event_id and last_event_id != self._watermark:
+                ids = [event[0] for event in self._backlog]
+                if last_event_id in ids:
+                    replay = list(self._backlog)[ids.index(last_event_id) + 1:]
+                else:
+                    replay = None
+            self._subscribers.add(subscriber)
+            self._idle_since = None
+            self._ensure_running()
+        return subscriber, replay
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._idle_since = time.monotonic()
+
+    def checkpoint(self, subscriber):
+        """
+        订阅者的队列已经取空时，返回广播器当前的水位线（该订阅者已收到此前的所有事件）
+        队列中还有未发送的事件时返回 None
+        """
+        with self._lock:
+            if subscriber.empty():
+                return self._watermark
+        return None
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscribers"] = len(self._subscribers)
+        return stats
+
+    def _ensure_running(self):
+        # 调用方已持有 self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="feed-broadcaster", daemon=True)
+            self._thread.start()
+
+    def _should_stop(self):
+        with self._lock:
+            if self._subscribers:
+                return False
+            if self._idle_since is not None and time.monotonic() - self._idle_since >= self.idle_timeout:
+                self._thread = None
+                return True
+            return False
+
+    def _run(self):
+        while not self._should_stop():
+            try:
+                self._poll_once()
+            except Exception as e:
+                logger.error(f"Feed broadcaster poll failed: {e}")
+                with self._lock:
+                    self._stats["poll_errors"] += 1
+            time.sleep(self.poll_interval)
+
+    def _poll_once(self):
+        if self._watermark is None:
+            # 只推送启动之后的变更；空表从最早的位置开始
+            self._watermark = self.fetch_latest() or encode_position("1970-01-01T00:00:00", 0)
+
+        has_more = True
+        while has_more:
+            rows, has_more = self.fetch_changes(decode_cursor(self._watermark))
+            with self._lock:
+                self._stats["polls"] += 1
+            if not rows:
+                break
+            self._publish([row_to_event(row) for row in rows], encode_watermark(rows[-1]))
+
+    def _publish(self, events, watermark):
+        with self._lock:
+            self._watermark = watermark
+            self._backlog.extend(events)
+            self._stats["events"] += len(events)
+            for subscriber in list(self._subscribers):
+                try:
+                    for event in events:
+                        subscriber.put_nowait(event)
+                except queue.Full:
+                    # 消费过慢的客户端直接断开，重连后通过 Last-Event-ID 补发
+                    self._subscribers.discard(subscriber)
+                    self._stats["dropped_subscribers"] += 1
+                    self._close(subscriber)
+
+    @staticmethod
+    def _close(subscriber):
+        """向订阅者发送结束信号（None）；队列已满时先腾出一个位置"""
+        try:
+            subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait(None)
+        except queue.Full:
+            pass
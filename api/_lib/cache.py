@@ -0,0 +1,167 @@
+"""
+进程内 TTL 缓存（LRU 淘汰 + stale-while-revalidate）
+
+Vercel 的函数实例在"热"状态下会复用模块级对象，
+把查询结果缓存在模块级 TTLCache 中，同一实例上的后续请求就不必再访问数据库。
+"""
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# get_or_load 返回的缓存状态
+HIT = "HIT"
+STALE = "STALE"
+MISS = "MISS"
+
+
+class TTLCache:
+    """
+    线程安全的 TTL 缓存
+
+    - ttl：条目在该时间内视为新鲜，直接返回
+    - stale_ttl：过期后的宽限期，期间直接返回旧值，并在后台触发一次刷新
+    - max_entries：超过后按 LRU 淘汰最久未使用的条目
+    - 同一个 key 同时只会有一个加载（未命中）或刷新（过期）在执行
+    """
+
+    def __init__(self, ttl, stale_ttl=0, max_entries=128, name="cache"):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.name = name
+
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> 正在加载该 key 的锁
+        self._refreshing = set()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get_or_load(self, key, loader):
+        """
+        读取缓存，未命中时调用 loader() 加载并写入缓存
+        返回 (value, status)，status 为 HIT / STALE / MISS
+        loader 抛出的异常会原样抛出，且不会写入缓存
+        """
+        if not self.enabled:
+            with self._lock:
+                self._stats["misses"] += 1
+            return loader(), MISS
+
+        value, status = self._lookup(key, loader)
+        if status is not None:
+            return value, status
+
+        # 未命中：同一个 key 只允许一个请求去加载，其余请求等待后直接读缓存
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            try:
+                value, status = self._lookup(key, loader, count_miss=False)
+                if status is not None:
+                    return value, status
+
+                value = loader()
+                self.set(key, value)
+                return value, MISS
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def _lookup(self, key, loader, count_miss=True):
+        """查找新鲜或可用的过期条目，找不到时返回 (None, None)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value, HIT
+
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._start_refresh(key, loader)
+                    return value, STALE
+
+                # 超过宽限期，视为未命中
+                del self._entries[key]
+
+            if count_miss:
+                self._stats["misses"] += 1
+        return None, None
+
+    def _start_refresh(self, key, loader):
+        thread = threading.Thread(target=self._refresh, args=(key, loader), daemon=True)
+        thread.start()
+
+    def _refresh(self, key, loader):
+        try:
+            value = loader()
+            self.set(key, value)
+            with self._lock:
+                self._stats["refreshes"] += 1
+        except Exception as e:
+            # 刷新失败时保留旧值，等下一次请求再试
+            logger.warning(f"[{self.name}] background refresh failed: {e}")
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key):
+        """只读取新鲜条目，不触发加载；不存在或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key=None):
+        """删除指定 key；不传 key 时清空整个缓存"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """返回命中/未命中等计数器的快照"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
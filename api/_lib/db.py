@@ -0,0 +1,119 @@
+"""
+共享的 Supabase 客户端：延迟导入、延迟创建、实例内复用
+
+supabase / httpx / gotrue 的导入和客户端创建要花上百毫秒。
+过去每个 handler 在模块导入时就创建客户端，OPTIONS 预检、参数校验失败这类不访问数据库的请求也要付出这部分冷启动时间。
+这里把导入和创建推迟到第一次真正访问数据库时，之后在同一个热实例中复用；
+首次创建的导入耗时和初始化耗时会记录到当前请求的日志中（db_import_ms / db_init_ms）。
+所有客户端共用 transport.py 中的连接池、超时和重试策略。
+
+    from api._lib.db import get_client
+
+    supabase = get_client()
+    if not supabase:
+        ...  # 未配置或初始化失败
+"""
+import logging
+import os
+import threading
+import time
+
+from api._lib.reqlog import current_log
+
+logger = logging.getLogger(__name__)
+
+# Supabase 配置
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
+SUPABASE_ANON_KEY = os.environ.get("SUPABASE_KEY", "")
+
+# 客户端种类 -> 使用的 key
+# data：服务端读写，优先 service_role（绕过 RLS），否则 anon
+# admin：管理接口（auth.admin.*），必须是 service_role
+# auth：sign_in_with_password 专用。登录后 supabase-py 会把用户的 access token 设置到该客户端上，
+#       与 data 客户端分开，避免后续查询变成以该用户身份执行
+CLIENT_KEYS = {
+    "data": SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY,
+    "admin": SUPABASE_SERVICE_ROLE_KEY,
+    "auth": SUPABASE_ANON_KEY or SUPABASE_SERVICE_ROLE_KEY,
+}
+
+_clients = {}
+_lock = threading.Lock()
+_create_client = None
+_configure_client = None
+# 本实例的初始化耗时（毫秒）：import，以及每种客户端的创建时间
+_timings = {}
+
+
+def is_configured(kind="data"):
+    """环境变量是否齐全（不导入 supabase）"""
+    return bool(SUPABASE_URL and CLIENT_KEYS[kind])
+
+
+def get_client(kind="data"):
+    """
+    返回共享的 Supabase 客户端，第一次调用时才导入并创建
+    未配置或初始化失败时返回 None（失败不缓存，下一次调用会重试）
+    """
+    client = _clients.get(kind)
+    if client is not None:
+        return client
+    if not is_configured(kind):
+        return None
+
+    with _lock:
+        client = _clients.get(kind)
+        if client is None:
+            client = _init_client(kind)
+            if client is not None:
+                _clients[kind] = client
+    return client
+
+
+def require_client(kind="data"):
+    """同 get_client，但不可用时抛出异常（用于缓存加载函数等以异常表示失败的场景）"""
+    client = get_client(kind)
+    if client is None:
+        raise RuntimeError("Supabase client unavailable")
+    return client
+
+
+def get_admin_client():
+    return get_client("admin")
+
+
+def get_auth_client():
+    return get_client("auth")
+
+
+def timings():
+    """本实例的导入 / 初始化耗时（毫秒）"""
+    return dict(_timings)
+
+
+def _import_create_client():
+    global _create_client, _configure_client
+    if _create_client is None:
+        started_at = time.perf_counter()
+        from supabase import create_client
+        from api._lib.transport import configure_client
+        _timings["import_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+        _create_client, _configure_client = create_client, configure_client
+    return _create_client
+
+
+def _init_client(kind):
+    log = current_log()
+    try:
+        create_client = _import_create_client()
+        started_at = time.perf_counter()
+        client = _configure_client(create_client(SUPABASE_URL, CLIENT_KEYS[kind]))
+        _timings[f"{kind}_init_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+    except Exception as e:
+        log.error("supabase_init_failed", client=kind, error=str(e))
+        return None
+
+    logger.info(f"Supabase {kind} client initialized: {_timings}")
+    log.set(db_import_ms=_timings.get("import_ms"), db_init_ms=_timings[f"{kind}_init_ms"], db_client=kind)
+    return client
@@ -0,0 +1,250 @@
+"""
+帖子列表（gold_signals）的查询与分页工具
+
+/api/posts、/api/posts/stream 与首页快照共用：keyset 分页游标、增量同步水位线、对应的数据库查询以及列表响应的序列化。
+查询函数都接收 Supabase 客户端作为第一个参数，失败时直接抛出异常。
+"""
+import base64
+import binascii
+from datetime import datetime
+import json
+
+from api._lib.http import JsonPayload, compute_etag, parse_timestamp
+from api._lib.reqlog import current_log
+
+# 返回给前端的字段，不暴露内部字段
+PUBLIC_KEYS = ("id", "content", "image_path", "created_at", "updated_at")
+# 摘要视图（?view=summary）：列表卡片只需要摘要和标记，全文通过 /api/posts/{id} 获取
+# excerpt / content_length / has_image 为数据库生成列，写入时计算一次
+SUMMARY_KEYS = ("id", "excerpt", "content_length", "has_image", "created_at", "updated_at")
+
+VIEW_KEYS = {
+    "full": PUBLIC_KEYS,
+    "summary": SUMMARY_KEYS,
+}
+PUBLIC_FIELDS = ", ".join(PUBLIC_KEYS)
+
+# 摘要长度（字符），与 database-setup.sql 中 excerpt 生成列一致
+EXCERPT_LENGTH = 120
+
+
+def encode_position(timestamp, row_id):
+    """把 (时间, id) 编码为不透明的位置标记（分页游标和增量水位线共用）"""
+    raw = json.dumps([timestamp, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(post):
+    """根据一条帖子的 (created_at, id) 生成不透明的分页游标"""
+    return encode_position(post["created_at"], post["id"])
+
+
+def encode_watermark(post):
+    """根据一条帖子的 (updated_at, id) 生成增量同步水位线"""
+    return encode_position(post.get("updated_at") or post["created_at"], post["id"])
+
+
+def decode_cursor(cursor):
+    """
+    解析分页游标或水位线，返回 (时间, id)
+    格式不合法时抛出 ValueError
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(created_at, str) or not isinstance(post_id, int) or isinstance(post_id, bool):
+        raise ValueError("Invalid cursor")
+    # 只接受合法的 ISO 时间，避免把任意字符串拼进查询条件
+    datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    return created_at, post_id
+
+
+def paginate(posts, limit):
+    """
+    从多取一条的结果中切出当前页，并计算下一页游标
+    查询时使用 limit + 1，多出来的那条说明后面还有数据
+    """
+    if len(posts) > limit:
+        page = posts[:limit]
+        return page, encode_cursor(page[-1])
+    return posts, None
+
+
+def view_fields(view):
+    """视图对应的查询字段"""
+    return ", ".join(VIEW_KEYS[view])
+
+
+def feed_shape(limit, cursor, view="full"):
+    """列表查询形状（参与 ETag 计算）：相同形状、相同数据的响应 ETag 相同"""
+    shape = f"feed:{limit}:{cursor or ''}"
+    return shape if view == "full" else f"{shape}:{view}"
+
+
+def summarize_post(post):
+    """在应用层生成摘要视图（假数据使用），规则与数据库生成列一致"""
+    content = post.get("content") or ""
+    return {
+        "id": post["id"],
+        "excerpt": " ".join(content.split())[:EXCERPT_LENGTH],
+        "content_length": len(content),
+        "has_image": bool((post.get("image_path") or "").strip()),
+        "created_at": post["created_at"],
+        "updated_at": post.get("updated_at"),
+    }
+
+
+def serialize_feed(posts, next_cursor, shape=""):
+    """
+    把一页帖子序列化为 JsonPayload
+    强 ETag 由查询形状、本页 id 序列以及最新的 (id, updated_at) 决定；
+    帖子新增、编辑、删除都会改变其中之一
+    """
+    newest = max(posts, key=lambda p: (p.get("updated_at") or p["created_at"], p["id"]), default=None)
+    response_data = {
+        "success": True,
+        "count": len(posts),
+        "data": posts,
+        "next_cursor": next_cursor,
+        # 增量同步的起点：之后用 ?since=<watermark> 只拉取变化的帖子
+        "watermark": encode_watermark(newest) if newest else None
+    }
+    # 不转义中文：UTF-8 每个汉字 3 字节，\uXXXX 转义后是 6 字节
+    body = json.dumps(response_data, ensure_ascii=False).encode()
+
+    if newest:
+        newest_updated_at = newest.get("updated_at") or newest["created_at"]
+        etag = compute_etag(shape, ",".join(str(p["id"]) for p in posts), newest["id"], newest_updated_at)
+        last_modified = parse_timestamp(newest_updated_at)
+    else:
+        etag = compute_etag(shape, "empty")
+        last_modified = None
+
+    return JsonPayload(body, etag=etag, last_modified=last_modified)
+
+
+def query_feed_page(client, limit, cursor_position, view="full"):
+    """
+    从数据库读取一页已发布的帖子
+    返回 (posts, next_cursor)；查询失败时抛出异常，避免把错误结果写入缓存
+    """
+    log = current_log()
+
+    # 只选择前端需要的字段，不暴露内部字段
+    query = client.table('gold_signals') \
+        .select(view_fields(view)) \
+        .eq('is_filtered', False) \
+        .is_('deleted_at', 'null') \
+        .eq('status', 'published')
+
+    # keyset 分页：从游标位置之后继续读取，走 idx_gold_signals_feed 索引，
+    # 无论翻到多深，每页的代价都相同（不使用 OFFSET）
+    if cursor_position:
+        cursor_created_at, cursor_id = cursor_position
+        query = query.or_(
+            f'created_at.lt."{cursor_created_at}",'
+            f'and(created_at.eq."{cursor_created_at}",id.lt.{cursor_id})'
+        )
+
+    # 多取一条用于判断是否还有下一页
+    with log.timed("db_feed_page"):
+        response = query \
+            .order('created_at', desc=True) \
+            .order('id', desc=True) \
+            .limit(limit + 1) \
+            .execute()
+
+    response_data = response.data if response and response.data else []
+    response_error = getattr(response, "error", None)
+    if response_error:
+        log.error("supabase_query_error", table="gold_signals", limit=limit, error=response_error)
+        raise RuntimeError(f"Supabase query error: {response_error}")
+
+    # 预览只在采样命中时才会被序列化
+    log.event(
+        "supabase_query_result",
+        table="gold_signals",
+        limit=limit,
+        count=len(response_data),
+        preview=lambda: [post["id"] for post in response_data[:2]],
+    )
+
+    return paginate(response_data, limit)
+
+
+def tombstone_reason(row):
+    """不再公开显示的帖子返回原因，仍然可见的返回 None"""
+    if row.get("deleted_at"):
+        return "deleted"
+    if row.get("is_filtered"):
+        return "filtered"
+    if row.get("status") != "published":
+        return row.get("status") or "unpublished"
+    return None
+
+
+def query_changes(client, limit, since_position, view="full"):
+    """
+    读取水位线之后新增或修改过的帖子（按 (updated_at, id) 升序）
+    包括已删除、被过滤、已归档的行，由调用方转换成删除标记
+    返回 (rows, has_more)；查询失败时抛出异常，避免把错误当作"没有变更"并推进水位线
+    """
+    log = current_log()
+    since_updated_at, since_id = since_position
+    with log.timed("db_changes"):
+        response = client.table('gold_signals') \
+            .select(f'{view_fields(view)}, status, is_filtered, deleted_at') \
+            .or_(
+                f'updated_at.gt."{since_updated_at}",'
+                f'and(updated_at.eq."{since_updated_at}",id.gt.{since_id})'
+            ) \
+            .order('updated_at') \
+            .order('id') \
+            .limit(limit + 1) \
+            .execute()
+
+    rows = response.data if response and response.data else []
+    response_error = getattr(response, "error", None)
+    if response_error:
+        log.error("supabase_query_error", table="gold_signals", limit=limit, error=response_error)
+        raise RuntimeError(f"Supabase query error: {response_error}")
+
+    log.event("supabase_changes_result", limit=limit, count=len(rows))
+    return rows[:limit], len(rows) > limit
+
+
+def public_post(row, view="full"):
+    """只保留返回给前端的字段"""
+    return {key: row.get(key) for key in VIEW_KEYS[view]}
+
+
+def query_post(client, post_id):
+    """读取单条已发布的帖子（全文），不存在或不可见时返回 None"""
+    log = current_log()
+    with log.timed("db_post"):
+        response = client.table('gold_signals') \
+            .select(PUBLIC_FIELDS) \
+            .eq('id', post_id) \
+            .eq('is_filtered', False) \
+            .is_('deleted_at', 'null') \
+            .eq('status', 'published') \
+            .limit(1) \
+            .execute()
+
+    rows = response.data if response and response.data else []
+    return rows[0] if rows else None
+
+
+def query_latest_watermark(client):
+    """返回整张表最新的 (updated_at, id) 水位线；表为空时返回 None"""
+    response = client.table('gold_signals') \
+        .select('id, updated_at, created_at') \
+        .order('updated_at', desc=True) \
+        .order('id', desc=True) \
+        .limit(1) \
+        .execute()
+    rows = response.data if response and response.data else []
+    return encode_watermark(rows[0]) if rows else None
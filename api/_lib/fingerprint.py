@@ -0,0 +1,185 @@
+"""
+设备指纹向量：把指纹编码为定长整数向量，与用户的历史设备批量比较
+
+过去登录只和第一个活跃会话逐字段比较，用户上周用过的设备也会被当成新设备。现在：
+- 指纹的每个加权字段哈希为一个非零 int32，缺失字段为 0，得到定长向量，随会话保存在 user_sessions.fingerprint_vector
+- 登录时取出该用户近期所有会话的向量（recent_fingerprints RPC），用一次 NumPy 矩阵运算算出与每台历史设备的加权相似度
+- 相似度定义与原来一致：两边都有的字段中，取值相同的字段权重占比
+
+跨账号的设备共享检测使用 MinHash/LSH：
+- 每个字段按权重展开为若干个 token（权重 0.05 为一个），得到加权 token 集合，两台设备 token 集合的 Jaccard 相似度近似加权相似度
+- 用 LSH_BANDS * LSH_ROWS 个哈希函数算出 MinHash 签名，每 LSH_ROWS 个值合成一个 band 哈希
+- 每个会话的 band 随会话写入 fingerprint_bands，按 (band_no, band_hash) 索引；相似的设备大概率至少有一个 band 相同，
+  查询只读取相同 band 的行，不扫描 user_sessions
+默认 10 个 band、每个 4 行：相似度 0.8 的设备至少命中一个 band 的概率约 99%，0.3 时约 8%。
+
+numpy 为可选依赖（首次比较时才导入），未安装时退回逐行计算，结果相同。
+"""
+import hashlib
+import json
+import os
+
+# 参与比较的历史会话：最近多少天、最多多少个
+FINGERPRINT_HISTORY_DAYS = int(os.environ.get("FINGERPRINT_HISTORY_DAYS", "90"))
+FINGERPRINT_HISTORY_LIMIT = int(os.environ.get("FINGERPRINT_HISTORY_LIMIT", "100"))
+
+# 字段与权重，顺序即向量中的位置（只能在末尾追加，否则已保存的向量会错位）
+FINGERPRINT_WEIGHTS = (
+    ('canvas_hash', 0.3),
+    ('audio_hash', 0.2),
+    ('screen_width', 0.1),
+    ('screen_height', 0.1),
+    ('device_pixel_ratio', 0.05),
+    ('platform', 0.1),
+    ('browser_family', 0.05),
+    ('browser_major', 0.05),
+    ('timezone_offset', 0.05),
+)
+
+VECTOR_WIDTH = len(FINGERPRINT_WEIGHTS)
+
+# 每个字段展开的 token 数（权重 / 0.05）
+FIELD_TOKENS = tuple(max(1, round(weight / 0.05)) for _, weight in FINGERPRINT_WEIGHTS)
+
+# LSH 参数：修改后已写入 fingerprint_bands 的 band 全部失效，需要清空重建
+LSH_BANDS = 10
+LSH_ROWS = 4
+
+# MinHash 哈希函数 h(x) = (a * x + b) mod p，系数由序号确定（各实例一致）
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def _coefficient(label):
+    digest = hashlib.blake2b(label.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % (_MERSENNE_PRIME - 1) + 1
+
+
+_MINHASH_A = tuple(_coefficient(f"minhash-a:{i}") for i in range(LSH_BANDS * LSH_ROWS))
+_MINHASH_B = tuple(_coefficient(f"minhash-b:{i}") for i in range(LSH_BANDS * LSH_ROWS))
+
+_numpy = None
+
+
+def _load_numpy():
+    """第一次比较时才导入 numpy；未安装时返回 False"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
+def hash_field(key, value):
+    """字段值 -> 非零 int32（0 表示字段缺失）"""
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode()
+    digest = hashlib.blake2b(key.encode() + b"=" + encoded, digest_size=4).digest()
+    return int.from_bytes(digest, "big", signed=True) or 1
+
+
+def encode_fingerprint(raw):
+    """指纹原始数据 -> 定长向量（list[int]）"""
+    raw = raw if isinstance(raw, dict) else {}
+    return [hash_field(key, raw[key]) if key in raw else 0 for key, _ in FINGERPRINT_WEIGHTS]
+
+
+def session_vector(row):
+    """历史会话的向量：优先使用已保存的向量，旧会话（迁移前创建）从 fingerprint_raw 现算"""
+    vector = row.get('fingerprint_vector')
+    if isinstance(vector, list) and len(vector) == VECTOR_WIDTH:
+        return vector
+    return encode_fingerprint(row.get('fingerprint_raw'))
+
+
+def similarity_scores(vector, history):
+    """
+    新指纹与每个历史向量的加权相似度（0-1），返回 list[float]
+    history 为 list[list[int]]，一次矩阵运算完成全部比较
+    """
+    if not history:
+        return []
+
+    numpy = _load_numpy()
+    if not numpy:
+        return [_similarity(vector, row) for row in history]
+
+    weights = numpy.array([weight for _, weight in FINGERPRINT_WEIGHTS])
+    current = numpy.asarray(vector, dtype=numpy.int32)
+    matrix = numpy.asarray(history, dtype=numpy.int32)
+
+    both = (matrix != 0) & (current != 0)
+    matched = both & (matrix == current)
+    total = both @ weights
+    score = matched @ weights
+    return numpy.divide(score, total, out=numpy.zeros_like(score), where=total > 0).tolist()
+
+
+def fetch_history(client, user_id):
+    """用户近期会话的指纹（recent_fingerprints RPC），返回行列表"""
+    response = client.rpc('recent_fingerprints', {
+        'p_user_id': user_id,
+        'p_since': f'{FINGERPRINT_HISTORY_DAYS} days',
+        'p_limit': FINGERPRINT_HISTORY_LIMIT,
+    }).execute()
+    return response.data or []
+
+
+def best_match(vector, rows):
+    """与历史设备中最相似的一台的相似度；没有历史会话时返回 None"""
+    scores = similarity_scores(vector, [session_vector(row) for row in rows])
+    return round(max(scores), 2) if scores else None
+
+
+def weighted_tokens(vector):
+    """向量 -> 加权 token 集合（31 位整数），缺失字段不产生 token"""
+    tokens = []
+    for position, (value, count) in enumerate(zip(vector, FIELD_TOKENS)):
+        if not value:
+            continue
+        for replica in range(count):
+            digest = hashlib.blake2b(f"{position}:{value}:{replica}".encode(), digest_size=4).digest()
+            tokens.append(int.from_bytes(digest, "big") & _MERSENNE_PRIME)
+    return tokens
+
+
+def minhash_signature(vector):
+    """MinHash 签名（LSH_BANDS * LSH_ROWS 个整数）；没有任何字段时返回 None"""
+    tokens = weighted_tokens(vector)
+    if not tokens:
+        return None
+
+    numpy = _load_numpy()
+    if not numpy:
+        return [min((a * token + b) % _MERSENNE_PRIME for token in tokens) for a, b in zip(_MINHASH_A, _MINHASH_B)]
+
+    values = numpy.asarray(tokens, dtype=numpy.uint64)
+    a = numpy.asarray(_MINHASH_A, dtype=numpy.uint64)
+    b = numpy.asarray(_MINHASH_B, dtype=numpy.uint64)
+    # a、token 都小于 2^31，乘积不会溢出 uint64
+    hashed = (numpy.outer(a, values) + b[:, None]) % numpy.uint64(_MERSENNE_PRIME)
+    return hashed.min(axis=1).tolist()
+
+
+def lsh_bands(vector):
+    """LSH band 哈希（有符号 64 位，对应 BIGINT），下标即 band_no；没有任何字段时返回 None"""
+    signature = minhash_signature(vector)
+    if signature is None:
+        return None
+    bands = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(b"".join(row.to_bytes(4, "big") for row in rows), digest_size=8).digest()
+        bands.append(int.from_bytes(digest, "big", signed=True))
+    return bands
+
+
+def _similarity(vector, other):
+    total = score = 0.0
+    for (_, weight), a, b in zip(FINGERPRINT_WEIGHTS, vector, other):
+        if a and b:
+            total += weight
+            if a == b:
+                score += weight
+    return score / total if total > 0 else 0.0
@@ -0,0 +1,279 @@
+"""
+HTTP 响应相关的共享工具：条件请求（ETag / Last-Modified / 304）与压缩协商
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import gzip
+import hashlib
+import zlib
+
+# brotli 为可选依赖，未安装时只协商 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩（压缩收益抵不过头部和 CPU 开销）
+MIN_COMPRESS_SIZE = 1024
+
+# 服务端偏好顺序：q 值相同时优先选择靠前的编码
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+class JsonPayload:
+    """
+    已序列化的 JSON 响应体及其缓存校验信息
+
+    body 为未压缩的字节；etag / last_modified 由生成响应体的数据计算。
+    压缩后的变体在第一次需要时生成并保存在对象上，
+    JsonPayload 放进缓存后，同一份数据不会被重复压缩；
+    已经压缩好的变体（如从快照读取的 gzip 字节）可以通过 variants 直接传入
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "_variants")
+
+    def __init__(self, body, etag=None, last_modified=None, variants=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self._variants = dict(variants or {})
+
+    def encoded(self, encoding):
+        """返回指定编码的响应体；identity 直接返回原始字节"""
+        if encoding == "identity":
+            return self.body
+        variant = self._variants.get(encoding)
+        if variant is None:
+            variant = compress(self.body, encoding)
+            self._variants[encoding] = variant
+        return variant
+
+
+def negotiate_encoding(accept_encoding, size):
+    """
+    根据 Accept-Encoding 选择响应编码（br / gzip / identity）
+    响应体太小时不压缩
+    """
+    if not accept_encoding or size < MIN_COMPRESS_SIZE:
+        return "identity"
+
+    weights = {}
+    for item in accept_encoding.split(','):
+        token, _, params = item.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            weights[token] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+class StreamCompressor:
+    """
+    流式压缩器：边生成边压缩，不需要先拿到完整的响应体
+    flush() 把已写入的数据立即压缩输出（不结束流），finish() 结束压缩流
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip 格式
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=5)
+        else:
+            self._obj = None
+
+    def compress(self, data):
+        if self._obj is None:
+            return data
+        if self.encoding == "gzip":
+            return self._obj.compress(data)
+        return self._obj.process(data)
+
+    def flush(self):
+        if self._obj is None:
+            return b""
+        if self.encoding == "gzip":
+            return self._obj.flush(zlib.Z_SYNC_FLUSH)
+        return self._obj.flush()
+
+    def finish(self):
+        if self._obj is None:
+            return b""
+        if self.encoding == "gzip":
+            return self._obj.flush()
+        return self._obj.finish()
+
+
+class ChunkedWriter:
+    """
+    以 chunked 传输编码写出响应体（HTTP/1.1）；
+    HTTP/1.0 客户端不支持 chunked，改为直接写出并在结束时关闭连接
+    """
+
+    def __init__(self, wfile, encoding, chunked=True):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.compressor = StreamCompressor(encoding)
+
+    def write(self, data):
+        self._write_raw(self.compressor.compress(data))
+
+    def flush(self):
+        """把目前为止的数据推给客户端（降低首字节时间）"""
+        self._write_raw(self.compressor.flush())
+        self.wfile.flush()
+
+    def close(self):
+        self._write_raw(self.compressor.finish())
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_raw(self, data):
+        if not data:
+            return
+        if self.chunked:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        else:
+            self.wfile.write(data)
+
+
+def start_streaming_response(handler_instance, send_headers=None, status=200,
+                             content_type='application/json; charset=utf-8'):
+    """
+    发送流式响应的状态行和响应头，返回 ChunkedWriter
+    send_headers 为可选回调，在状态行之后调用，用于添加 CORS 等其他响应头
+    """
+    # 长度未知，按"足够大"处理，只要客户端接受就压缩
+    encoding = negotiate_encoding(handler_instance.headers.get('Accept-Encoding'), MIN_COMPRESS_SIZE)
+    chunked = handler_instance.request_version == 'HTTP/1.1'
+    if chunked:
+        # BaseHTTPRequestHandler 默认以 HTTP/1.0 响应，chunked 需要 HTTP/1.1
+        handler_instance.protocol_version = 'HTTP/1.1'
+
+    handler_instance.send_response(status)
+    handler_instance.send_header('Content-Type', content_type)
+    handler_instance.send_header('Vary', 'Accept-Encoding')
+    if encoding != "identity":
+        handler_instance.send_header('Content-Encoding', encoding)
+    if chunked:
+        handler_instance.send_header('Transfer-Encoding', 'chunked')
+    handler_instance.send_header('Connection', 'close')
+    if send_headers:
+        send_headers()
+    handler_instance.end_headers()
+    handler_instance.close_connection = True
+    return ChunkedWriter(handler_instance.wfile, encoding, chunked=chunked)
+
+
+def etag_for_encoding(etag, encoding):
+    """不同内容编码的字节不同，强 ETag 也需要区分：在引号内追加编码后缀"""
+    if not etag or encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def send_body(handler_instance, body, content_type='application/json; charset=utf-8'):
+    """
+    协商压缩编码后写出响应体（调用前只需 send_response 和其他响应头，不要 end_headers）
+    body 可以是 bytes，也可以是 JsonPayload（会复用其中缓存的压缩结果）
+    """
+    payload = body if isinstance(body, JsonPayload) else JsonPayload(body)
+    encoding = negotiate_encoding(handler_instance.headers.get('Accept-Encoding'), len(payload.body))
+    data = payload.encoded(encoding)
+
+    handler_instance.send_header('Content-Type', content_type)
+    handler_instance.send_header('Vary', 'Accept-Encoding')
+    if encoding != "identity":
+        handler_instance.send_header('Content-Encoding', encoding)
+    if payload.etag:
+        handler_instance.send_header('ETag', etag_for_encoding(payload.etag, encoding))
+    handler_instance.send_header('Content-Length', str(len(data)))
+    handler_instance.end_headers()
+    handler_instance.wfile.write(data)
+
+
+def compute_etag(*parts):
+    """根据若干标识字段生成强 ETag（带双引号）"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def parse_timestamp(value):
+    """解析数据库返回的 ISO 时间；不带时区的时间按 UTC 处理"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def format_http_date(value):
+    """datetime -> RFC 7231 HTTP-date（Last-Modified 使用）"""
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def strip_encoding_suffix(tag):
+    """去掉 W/ 前缀和 etag_for_encoding 追加的编码后缀，得到原始 ETag"""
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for encoding in ("br", "gzip"):
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def is_not_modified(request_headers, etag, last_modified):
+    """
+    判断条件请求是否可以返回 304
+    If-None-Match 优先；只有在没有 If-None-Match 时才看 If-Modified-Since
+    """
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match:
+        if not etag:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # If-None-Match 使用弱比较，忽略 W/ 前缀
+        candidates = [strip_encoding_suffix(tag.strip()) for tag in if_none_match.split(',')]
+        return etag in candidates
+
+    if_modified_since = request_headers.get('If-Modified-Since')
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since is None:
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP-date 只精确到秒
+        return last_modified.replace(microsecond=0) <= since
+
+    return False
@@ -0,0 +1,156 @@
+"""
+结构化、按比例采样的请求日志
+
+- 每个请求一条汇总日志（路由、方法、状态码、耗时、各步骤耗时及附加字段），以单行 JSON 输出
+- 按 LOG_SAMPLE_RATE 采样：未采样的请求只做几次计时，不做任何序列化和 I/O
+- 错误和慢请求（超过 LOG_SLOW_MS）无论是否采样都会记录
+- 字段值可以是无参函数，只在确定要输出时才求值（延迟格式化）
+
+handler 通过 RequestLogMixin 接入：
+
+    class handler(RequestLogMixin, BaseHTTPRequestHandler):
+        route = "/api/posts"
+
+请求处理过程中用 self.request_log 或 current_log() 记录事件。
+"""
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger("api.request")
+
+IS_PRODUCTION = os.environ.get("VERCEL_ENV") == "production"
+
+# 采样率：生产环境默认 1%，其他环境全部记录
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01" if IS_PRODUCTION else "1"))
+# 慢请求阈值（毫秒），超过后必定记录
+LOG_SLOW_MS = float(os.environ.get("LOG_SLOW_MS", "1000"))
+
+_current = contextvars.ContextVar("request_log", default=None)
+
+
+class LazyJson:
+    """日志消息对象：只有日志真正输出时才序列化为 JSON"""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        record = {key: (value() if callable(value) else value) for key, value in self.record.items()}
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+
+class RequestLog:
+    """单个请求的日志上下文"""
+
+    def __init__(self, route, method=None, sample_rate=None):
+        self.route = route
+        self.method = method
+        self.status = None
+        self.started_at = time.perf_counter()
+        rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.sampled = rate >= 1 or random.random() < rate
+        self.fields = {}
+        self.timings = {}
+        self._error_logged = False
+
+    def set(self, **fields):
+        """附加到汇总日志上的字段（值可以是无参函数）"""
+        self.fields.update(fields)
+
+    def event(self, name, **fields):
+        """采样命中时立即输出一条事件日志"""
+        if self.sampled:
+            self._emit(logging.INFO, name, fields)
+
+    def error(self, name, **fields):
+        """错误日志：不受采样影响"""
+        self._error_logged = True
+        self._emit(logging.ERROR, name, fields)
+
+    @contextmanager
+    def timed(self, step):
+        """记录一个步骤的耗时（毫秒），同名步骤累加"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started_at) * 1000
+            self.timings[step] = round(self.timings.get(step, 0) + elapsed, 2)
+
+    def duration_ms(self):
+        return round((time.perf_counter() - self.started_at) * 1000, 2)
+
+    def finish(self):
+        """请求结束时调用：采样命中、出错或慢请求才输出汇总日志"""
+        duration_ms = self.duration_ms()
+        failed = self.status is not None and self.status >= 500
+        if not (self.sampled or failed or self._error_logged or duration_ms >= LOG_SLOW_MS):
+            return
+        fields = dict(self.fields)
+        fields["status"] = self.status
+        fields["duration_ms"] = duration_ms
+        if self.timings:
+            fields["timings_ms"] = self.timings
+        self._emit(logging.ERROR if failed else logging.INFO, "request", fields)
+
+    def _emit(self, level, name, fields):
+        if not logger.isEnabledFor(level):
+            return
+        record = {"event": name, "route": self.route, "method": self.method}
+        record.update(fields)
+        logger.log(level, "%s", LazyJson(record))
+
+
+class _NullLog(RequestLog):
+    """请求上下文之外（后台线程、模块导入）使用：只记录错误"""
+
+    def __init__(self):
+        super().__init__(route=None, sample_rate=0)
+
+
+def current_log():
+    """返回当前请求的 RequestLog；不在请求上下文中时返回只记录错误的空日志"""
+    return _current.get() or _NullLog()
+
+
+class RequestLogMixin:
+    """
+    为 BaseHTTPRequestHandler 接入请求日志
+
+    - 每个请求创建 self.request_log，结束时输出汇总日志
+    - 记录 send_response 的状态码
+    - 关闭 BaseHTTPRequestHandler 默认逐请求写 stderr 的访问日志
+    """
+
+    route = None
+
+    def handle_one_request(self):
+        self.request_log = RequestLog(self.route or type(self).__module__)
+        token = _current.set(self.request_log)
+        try:
+            super().handle_one_request()
+        except Exception as e:
+            self.request_log.error("unhandled_exception", error=str(e))
+            raise
+        finally:
+            _current.reset(token)
+            # 解析请求行之前连接就关闭时没有 command，不记录
+            if getattr(self, "command", None):
+                self.request_log.method = self.command
+                self.request_log.finish()
+
+    def log_request(self, code='-', size='-'):
+        try:
+            self.request_log.status = int(code)
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
@@ -0,0 +1,79 @@
+"""
+帖子全文搜索（/api/posts/search）
+
+切词与排序都在数据库中完成（见 database-setup.sql 中的 cjk_tokens / search_gold_signals）：
+中文按二元组切分后写入 GIN 索引的 tsvector 生成列，查询不会退化为对 content 的 ILIKE 全表扫描。
+这里只负责查询参数的规范化、分页游标以及 RPC 调用。
+"""
+import base64
+import binascii
+import json
+import re
+
+from api._lib.feed import encode_position, public_post
+from api._lib.reqlog import current_log
+
+# 查询词最大长度（字符）
+MAX_QUERY_LENGTH = 64
+
+# 与数据库切词规则一致：英文字母数字或中日韩字符，至少有一个才值得查询
+_SEARCHABLE = re.compile(r'[A-Za-z0-9\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def normalize_query(raw):
+    """去掉首尾空白并合并连续空白；超过长度上限时抛出 ValueError"""
+    query = " ".join((raw or "").split())
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError("Search query too long")
+    return query
+
+
+def is_searchable(query):
+    """查询词中是否有可以命中索引的字符（纯标点等直接返回空结果，不查询数据库）"""
+    return bool(_SEARCHABLE.search(query))
+
+
+def encode_search_cursor(row):
+    """根据一条结果的 (rank, id) 生成分页游标"""
+    return encode_position(row["rank"], row["id"])
+
+
+def decode_search_cursor(cursor):
+    """
+    解析搜索分页游标，返回 (rank, id)
+    格式不合法时抛出 ValueError
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    if (not isinstance(rank, (int, float)) or isinstance(rank, bool)
+            or not isinstance(row_id, int) or isinstance(row_id, bool)):
+        raise ValueError("Invalid cursor")
+    return rank, row_id
+
+
+def query_search_page(client, query, limit, cursor_position):
+    """
+    调用 search_gold_signals RPC 读取一页搜索结果（按相关度、id 倒序）
+    返回 (posts, next_cursor)；查询失败时抛出异常
+    """
+    log = current_log()
+    after_rank, after_id = cursor_position or (None, None)
+
+    # 多取一条用于判断是否还有下一页
+    with log.timed("db_search"):
+        response = client.rpc('search_gold_signals', {
+            "search_query": query,
+            "result_limit": limit + 1,
+            "after_rank": after_rank,
+            "after_id": after_id,
+        }).execute()
+
+    rows = response.data if response and response.data else []
+    log.event("supabase_search_result", limit=limit, count=len(rows))
+
+    next_cursor = encode_search_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [public_post(row) for row in rows[:limit]], next_cursor
@@ -0,0 +1,218 @@
+"""
+会话心跳：账号状态缓存与 last_seen_at 写回（write-behind）
+
+每个登录中的标签页每 60 秒发送一次心跳。last_seen_at 只用于登录时判断"15 分钟内是否有活跃会话"，
+不需要精确到每一次心跳：
+
+- 数据库中的 last_seen_at 距本次心跳不到 HEARTBEAT_TOUCH_INTERVAL 时不写入；
+  携带有效会话令牌的心跳不读数据库，按令牌签发时的 last_seen_at 与本实例最近记下的时间判断
+- 需要写入时先记在实例内的 TouchBuffer 中（同一会话只保留最新时间），
+  最早的一条等待 HEARTBEAT_FLUSH_INTERVAL 后用一次 touch_sessions RPC 批量写回：
+  由之后的心跳顺带写回，没有心跳到达本实例时由后台定时器写回；进程正常退出时写回剩余的时间
+
+实例运行期间，活跃会话的 last_seen_at 最多落后 HEARTBEAT_TOUCH_INTERVAL + HEARTBEAT_FLUSH_INTERVAL
+再加一个心跳间隔（默认约 6.5 分钟）。Serverless 实例在两次请求之间可能被冻结，定时器要等实例恢复后才执行；
+实例被回收时尚未写回的时间会丢失。这两种情况下数据库中的值仍然过期，下一次心跳落到其他实例时
+会重新记下，因此最坏情况下还要再加一个 HEARTBEAT_FLUSH_INTERVAL 和一个心跳间隔（默认约 8 分钟），
+仍在 15 分钟的活跃窗口之内；只有该会话的心跳一直落在同一个被冻结的实例上时才会超出。
+令牌心跳与查询数据库的心跳按同样的间隔写回，以上上限与 SESSION_TOKEN_TTL 无关。
+
+账号状态只在登录重新计算风险分数、管理员封禁等少数情况下变化。StatusCache 在实例内缓存
+session_id -> (user_id, account_status, last_seen_at)，每个条目带有读取时的全局状态版本号：
+实例每隔 STATUS_VERSION_POLL_INTERVAL 读取一次全局版本号（数据库触发器在状态变化时递增），
+条目的版本号落后即视为失效。缓存命中的心跳不访问数据库，封禁最迟在一个检查间隔加一个心跳间隔后生效。
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from api._lib.cache import TTLCache
+from api._lib.db import get_client
+from api._lib.http import parse_timestamp
+from api._lib.reqlog import current_log
+
+# last_seen_at 早于本次心跳超过该值（秒）才需要写回
+HEARTBEAT_TOUCH_INTERVAL = float(os.environ.get("HEARTBEAT_TOUCH_INTERVAL", "300"))
+# 待写回的心跳时间最多缓冲多久（秒）、最多缓冲多少个会话，超过后批量写回
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get("HEARTBEAT_FLUSH_INTERVAL", "30"))
+HEARTBEAT_FLUSH_MAX = int(os.environ.get("HEARTBEAT_FLUSH_MAX", "500"))
+
+# 账号状态缓存（秒）：条目最长保留时间（版本号未变化时也会过期重新读取），STATUS_CACHE_TTL=0 可关闭
+STATUS_CACHE_TTL = float(os.environ.get("STATUS_CACHE_TTL", "300"))
+STATUS_CACHE_MAX_ENTRIES = int(os.environ.get("STATUS_CACHE_MAX_ENTRIES", "10000"))
+# 检查全局状态版本号的间隔（秒），即封禁生效的最大延迟
+STATUS_VERSION_POLL_INTERVAL = float(os.environ.get("STATUS_VERSION_POLL_INTERVAL", "10"))
+
+
+def needs_touch(last_seen_at, now):
+    """数据库中的 last_seen_at（ISO 字符串或 datetime）是否已经过期到需要写回"""
+    stored = last_seen_at if isinstance(last_seen_at, datetime) else parse_timestamp(last_seen_at)
+    return stored is None or (now - stored).total_seconds() >= HEARTBEAT_TOUCH_INTERVAL
+
+
+class TouchBuffer:
+    """
+    实例内待写回的心跳时间：session_id -> 最新心跳时间，线程安全
+    传入 client_factory 时，缓冲区从空变为非空会启动一个定时器，flush_interval 后在后台写回
+    写回后仍在 recent 中保留 HEARTBEAT_TOUCH_INTERVAL，令牌心跳据此判断本实例是否刚记下过
+    """
+
+    def __init__(self, flush_interval=HEARTBEAT_FLUSH_INTERVAL, max_pending=HEARTBEAT_FLUSH_MAX,
+                 client_factory=None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.client_factory = client_factory
+        self.recent = TTLCache(ttl=HEARTBEAT_TOUCH_INTERVAL, max_entries=STATUS_CACHE_MAX_ENTRIES,
+                               name="recent_touches")
+        self._pending = {}
+        self._first_added_at = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, session_id, seen_at):
+        with self._lock:
+            current = self._pending.get(session_id)
+            if current is None or seen_at > current:
+                self._pending[session_id] = seen_at
+            if self._first_added_at is None:
+                self._first_added_at = time.monotonic()
+                self._schedule()
+        recent = self.recent.get(session_id)
+        self.recent.set(session_id, seen_at if recent is None else max(seen_at, recent))
+
+    def last_added(self, session_id):
+        """本实例最近 HEARTBEAT_TOUCH_INTERVAL 内为该会话记下的心跳时间，没有时返回 None"""
+        return self.recent.get(session_id)
+
+    def _schedule(self):
+        # 调用方已持有锁；同一时间只有一个定时器
+        if self.client_factory is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush_pending()
+
+    def due(self):
+        """最早的一条已等待超过 flush_interval，或缓冲的会话数达到上限"""
+        with self._lock:
+            if not self._pending:
+                return False
+            return (len(self._pending) >= self.max_pending
+                    or time.monotonic() - self._first_added_at >= self.flush_interval)
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._first_added_at = None
+        return pending
+
+    def flush(self, client):
+        """批量写回，返回数据库实际更新的行数；失败时把这批时间放回缓冲区再抛出异常"""
+        pending = self.drain()
+        if not pending:
+            return 0
+
+        session_ids = list(pending)
+        log = current_log()
+        try:
+            with log.timed("db_touch_sessions"):
+                response = client.rpc('touch_sessions', {
+                    'p_session_ids': session_ids,
+                    'p_seen_at': [pending[session_id].isoformat() for session_id in session_ids],
+                }).execute()
+        except Exception:
+            for session_id, seen_at in pending.items():
+                self.add(session_id, seen_at)
+            raise
+
+        touched = response.data if isinstance(response.data, int) else 0
+        log.set(touch_flushed=len(session_ids), touch_written=touched)
+        return touched
+
+    def flush_pending(self):
+        """定时器和进程退出时调用：用 client_factory 取得客户端写回，失败只记录日志（时间已放回缓冲区）"""
+        if not self._pending or self.client_factory is None:
+            return
+        try:
+            client = self.client_factory()
+            if client is not None:
+                self.flush(client)
+        except Exception as e:
+            current_log().error("touch_flush_failed", pending=len(self), error=str(e))
+
+
+class StatusCache:
+    """会话的账号状态缓存：按全局状态版本号失效，线程安全"""
+
+    def __init__(self, ttl=STATUS_CACHE_TTL, max_entries=STATUS_CACHE_MAX_ENTRIES,
+                 poll_interval=STATUS_VERSION_POLL_INTERVAL):
+        self.entries = TTLCache(ttl=ttl, max_entries=max_entries, name="account_status")
+        self.poll_interval = poll_interval
+        self.version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def lookup(self, client, session_id):
+        """返回仍然有效的缓存条目，没有或已失效时返回 None"""
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None
+        version = self.current_version(client)
+        if version is None or entry["status_version"] < version:
+            return None
+        return entry
+
+    def store(self, session_id, row):
+        """缓存 heartbeat RPC 返回的一行；被封禁或资料不存在的会话不缓存"""
+        self.observe_version(row.get("status_version"))
+        if row.get("account_status") in (None, "banned") or row.get("status_version") is None:
+            self.entries.invalidate(session_id)
+            return
+        self.entries.set(session_id, dict(row))
+
+    def touched(self, session_id, seen_at):
+        """记下心跳时间后同步更新缓存中的 last_seen_at，之后的心跳不再重复记录"""
+        entry = self.entries.get(session_id)
+        if entry is not None:
+            self.entries.set(session_id, {**entry, "last_seen_at": seen_at.isoformat()})
+
+    def current_version(self, client):
+        """全局状态版本号：距上次检查超过 poll_interval 时重新读取；读取失败返回 None（不使用缓存）"""
+        with self._lock:
+            fresh = self._checked_at is not None and time.monotonic() - self._checked_at < self.poll_interval
+            if fresh:
+                return self.version
+
+        try:
+            with current_log().timed("db_status_version"):
+                response = client.rpc('account_status_version', {}).execute()
+        except Exception as e:
+            current_log().error("status_version_failed", error=str(e))
+            return None
+        self.observe_version(response.data)
+        return self.version
+
+    def observe_version(self, version):
+        """记录读到的全局版本号（heartbeat RPC 同时返回版本号，相当于一次检查）"""
+        if not isinstance(version, int):
+            return
+        with self._lock:
+            if self.version is None or version >= self.version:
+                self.version = version
+                self._checked_at = time.monotonic()
+
+
+# 模块级对象：同一实例内的所有心跳请求共用
+touch_buffer = TouchBuffer(client_factory=get_client)
+atexit.register(touch_buffer.flush_pending)
+status_cache = StatusCache()
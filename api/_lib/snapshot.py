@@ -0,0 +1,92 @@
+"""
+首页快照：最新一页帖子预先序列化、压缩后存放在 feed_snapshots 表中
+
+- gold_signals 的新增、编辑、软删除由数据库触发器递增 feed_snapshot_state.generation，
+  旧快照随即失效；无论由哪里写入（Bot、后台直接写库）都不会读到过期数据
+- /api/posts 的首页请求通过 get_feed_snapshot RPC 一次主键读取拿到快照；
+  快照缺失时回退到实时查询，并顺便写回快照（之后的实例都直接命中）
+
+写回时带上查询前读到的 generation，期间如有新的写入，store_feed_snapshot 会拒绝这份旧数据。
+"""
+import base64
+import gzip
+
+from api._lib.feed import feed_shape, query_feed_page, serialize_feed
+from api._lib.http import JsonPayload, parse_timestamp
+from api._lib.reqlog import current_log
+
+# 快照名：首页（无游标）列表；摘要视图的快照名为 "latest:summary"
+LATEST_SNAPSHOT = "latest"
+# 快照包含的帖子数，与 /api/posts 的默认每页条数一致
+FEED_SNAPSHOT_SIZE = 20
+
+
+def load_snapshot(client, name=LATEST_SNAPSHOT):
+    """
+    读取快照，返回 (payload, generation)
+    快照不存在或已失效时 payload 为 None，generation 为当前数据版本（写回快照时使用）
+    """
+    log = current_log()
+    with log.timed("db_snapshot"):
+        response = client.rpc('get_feed_snapshot', {"snapshot_name": name}).execute()
+
+    rows = response.data if response and response.data else []
+    if not rows:
+        return None, None
+    row = rows[0]
+    if not row.get("body_gzip"):
+        return None, row.get("generation")
+
+    compressed = base64.b64decode(row["body_gzip"])
+    payload = JsonPayload(
+        gzip.decompress(compressed),
+        etag=row["etag"],
+        last_modified=parse_timestamp(row.get("last_modified")),
+        # 直接复用快照中的 gzip 字节，不再重复压缩
+        variants={"gzip": compressed},
+    )
+    return payload, row["generation"]
+
+
+def store_snapshot(client, payload, generation, name=LATEST_SNAPSHOT):
+    """写回快照；数据版本已经变化时数据库会拒绝写入，返回 False"""
+    response = client.rpc('store_feed_snapshot', {
+        "snapshot_name": name,
+        "snapshot_body_gzip": base64.b64encode(payload.encoded("gzip")).decode(),
+        "snapshot_etag": payload.etag,
+        "snapshot_last_modified": payload.last_modified.isoformat() if payload.last_modified else None,
+        "built_generation": generation,
+    }).execute()
+    return bool(response and response.data)
+
+
+def snapshot_name(view="full"):
+    return LATEST_SNAPSHOT if view == "full" else f"{LATEST_SNAPSHOT}:{view}"
+
+
+def build_snapshot(client, size, generation, view="full"):
+    """实时查询首页并写回快照，返回 JsonPayload；写回失败不影响本次响应"""
+    posts, next_cursor = query_feed_page(client, size, None, view)
+    payload = serialize_feed(posts, next_cursor, feed_shape(size, None, view))
+    if generation is not None:
+        try:
+            stored = store_snapshot(client, payload, generation, snapshot_name(view))
+            current_log().set(snapshot_stored=stored)
+        except Exception as e:
+            current_log().error("snapshot_store_failed", error=str(e))
+    return payload
+
+
+def get_feed_snapshot(client, size=FEED_SNAPSHOT_SIZE, view="full"):
+    """首页列表：优先读取快照，缺失时实时查询并写回"""
+    try:
+        payload, generation = load_snapshot(client, snapshot_name(view))
+    except Exception as e:
+        # 快照表不可用（未执行建表脚本、权限不足等）时只走实时查询
+        current_log().error("snapshot_load_failed", error=str(e))
+        payload, generation = None, None
+
+    current_log().set(snapshot="hit" if payload else "miss")
+    if payload:
+        return payload
+    return build_snapshot(client, size, generation, view)
@@ -0,0 +1,123 @@
+"""
+会话令牌：HMAC 签名的短期令牌，心跳在内存中校验，不必每次查询 user_sessions
+
+登录成功后下发令牌，内容为 会话 id、用户 id、账号状态快照、状态版本号、签发时的 last_seen_at 和过期时间。
+心跳携带令牌时：
+- 签名有效、未过期、不在撤销名单中、全局状态版本号没有超过令牌中的版本号：直接按令牌中的状态响应，
+  last_seen_at 按令牌中的值判断是否需要写回（见 api/_lib/sessions.py）
+- 否则（过期或状态可能已变化）查询一次数据库，会话仍然有效时轮换出新令牌
+
+令牌格式：base64url(JSON 内容) + "." + base64url(HMAC-SHA256 签名)
+未配置 SESSION_TOKEN_SECRET 时不下发令牌，心跳仍按 session_id 查询数据库。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from api._lib.http import parse_timestamp
+
+# 签名密钥（至少 32 个随机字符），未配置时关闭会话令牌
+SESSION_TOKEN_SECRET = os.environ.get("SESSION_TOKEN_SECRET", "")
+# 令牌有效期（秒）：过期后心跳查询一次数据库并轮换令牌
+SESSION_TOKEN_TTL = int(os.environ.get("SESSION_TOKEN_TTL", "300"))
+
+
+def tokens_enabled():
+    return bool(SESSION_TOKEN_SECRET)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(message):
+    return hmac.new(SESSION_TOKEN_SECRET.encode(), message, hashlib.sha256).digest()
+
+
+def issue_token(session_id, user_id, account_status, status_version, last_seen_at=None, now=None):
+    """签发令牌，返回 (令牌, 过期时间戳)；last_seen_at 为签发时数据库中（或已记下待写回）的心跳时间"""
+    issued_at = int(now if now is not None else time.time())
+    expires_at = issued_at + SESSION_TOKEN_TTL
+    claims = {
+        "sid": str(session_id),
+        "uid": str(user_id),
+        "st": account_status,
+        "sv": status_version,
+        "iat": issued_at,
+        "exp": expires_at,
+    }
+    seen_at = parse_timestamp(last_seen_at)
+    if seen_at is not None:
+        claims["ls"] = int(seen_at.timestamp())
+    message = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{message}.{_b64encode(_sign(message.encode()))}", expires_at
+
+
+def verify_token(token):
+    """校验签名并返回令牌内容；格式错误或签名不符时返回 None（不检查是否过期）"""
+    if not tokens_enabled() or not isinstance(token, str):
+        return None
+    message, _, signature = token.partition(".")
+    try:
+        if not hmac.compare_digest(_b64decode(signature), _sign(message.encode())):
+            return None
+        claims = json.loads(_b64decode(message))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict) or not claims.get("sid") or not isinstance(claims.get("exp"), int):
+        return None
+    return claims
+
+
+def is_expired(claims, now=None):
+    return (now if now is not None else time.time()) >= claims["exp"]
+
+
+def token_last_seen(claims):
+    """令牌签发时的 last_seen_at（UTC datetime）；旧令牌没有该字段时返回 None"""
+    seen_at = claims.get("ls")
+    if not isinstance(seen_at, int):
+        return None
+    return datetime.fromtimestamp(seen_at, timezone.utc)
+
+
+class Denylist:
+    """
+    已撤销的会话：session_id -> 该会话最后一个令牌的过期时间
+    令牌过期后心跳必然查询数据库，条目随之清除，名单大小不超过有效期内登出的会话数
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, session_id, until):
+        with self._lock:
+            self._entries[str(session_id)] = max(until, self._entries.get(str(session_id), 0))
+
+    def contains(self, session_id, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._purge(now)
+            return str(session_id) in self._entries
+
+    def _purge(self, now):
+        expired = [session_id for session_id, until in self._entries.items() if until <= now]
+        for session_id in expired:
+            del self._entries[session_id]
+
+
+# 模块级撤销名单：同一实例内共用（单应用模式下所有接口共用）
+session_denylist = Denylist()
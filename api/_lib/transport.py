@@ -0,0 +1,205 @@
+"""
+数据库请求的 HTTP 传输层：连接池、超时与重试预算
+
+supabase-py 默认为每个客户端各建一个 httpx 连接池，没有连接超时，读超时是 120 秒；
+PostgREST 响应变慢时，函数实例会一直挂到被 Vercel 强制结束。这里统一配置：
+
+- 所有客户端（data / admin / auth）共用一个连接池，热实例中的后续请求复用 keep-alive 连接；
+  安装了 h2 时使用 HTTP/2，同一连接上多路复用
+- 每次调用都有独立的连接 / 读取超时（DB_CONNECT_TIMEOUT / DB_READ_TIMEOUT）
+- 只重试安全的失败：连接没有建立（请求未发出）时任何方法都可以重试；
+  已发出的请求只有幂等读取（GET / HEAD、只读 RPC）在 502/503/504 或连接被断开时重试。
+  读取超时不重试：服务端已经很慢，重试只会放大负载和延迟
+- 重试受令牌桶预算限制：每个请求存入 DB_RETRY_BUDGET_RATIO 个令牌，每次重试消耗 1 个，
+  数据库整体故障时重试量不超过正常请求量的固定比例，不会形成重试风暴
+- 退避使用 full jitter，且总耗时不超过 DB_RETRY_DEADLINE
+
+    from api._lib.transport import configure_client
+
+    configure_client(client)  # 由 db.get_client 在创建客户端时调用
+"""
+import importlib.util
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from api._lib.reqlog import current_log
+
+# 超时（秒）：连接、读取（写入同读取）、等待连接池空闲连接
+DB_CONNECT_TIMEOUT = float(os.environ.get("DB_CONNECT_TIMEOUT", "2"))
+DB_READ_TIMEOUT = float(os.environ.get("DB_READ_TIMEOUT", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "1"))
+
+# 连接池：单个实例同时只处理一个请求，少量连接即可；空闲连接保留时间（秒）
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "10"))
+DB_KEEPALIVE_EXPIRY = float(os.environ.get("DB_KEEPALIVE_EXPIRY", "60"))
+
+# 重试：单次调用最多重试次数、退避基数与上限（秒）、含重试在内的总耗时上限（秒）
+DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", "2"))
+DB_RETRY_BASE_DELAY = float(os.environ.get("DB_RETRY_BASE_DELAY", "0.05"))
+DB_RETRY_MAX_DELAY = float(os.environ.get("DB_RETRY_MAX_DELAY", "0.5"))
+DB_RETRY_DEADLINE = float(os.environ.get("DB_RETRY_DEADLINE", "3"))
+
+# 重试预算：每个请求存入的令牌数、令牌上限（也是初始值）
+DB_RETRY_BUDGET_RATIO = float(os.environ.get("DB_RETRY_BUDGET_RATIO", "0.1"))
+DB_RETRY_BUDGET_MAX = float(os.environ.get("DB_RETRY_BUDGET_MAX", "10"))
+
+# 幂等方法：请求已发出后仍可安全重试
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# 只读 RPC（数据库中声明为 STABLE 的函数）：supabase-py 总是用 POST 调用，按函数名视为幂等读取
+READ_ONLY_RPCS = frozenset({"get_feed_snapshot", "search_gold_signals", "account_status_version", "recent_fingerprints",
+                            "similar_devices"})
+# 网关类错误：请求大概率没有被执行
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class RetryBudget:
+    """令牌桶重试预算：实例内共享，线程安全"""
+
+    def __init__(self, ratio=DB_RETRY_BUDGET_RATIO, capacity=DB_RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """取出一个令牌，预算不足时返回 False"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def is_idempotent(request):
+    if request.method in IDEMPOTENT_METHODS:
+        return True
+    path = request.url.path
+    return "/rpc/" in path and path.rsplit("/", 1)[-1] in READ_ONLY_RPCS
+
+
+def backoff_delay(attempt):
+    """full jitter：[0, min(上限, 基数 * 2^attempt)) 内均匀随机"""
+    return random.uniform(0, min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class RetryTransport(httpx.BaseTransport):
+    """在共享连接池之上按预算重试安全的失败"""
+
+    def __init__(self, transport, budget):
+        self._transport = transport
+        self._budget = budget
+
+    def handle_request(self, request):
+        self._budget.deposit()
+        idempotent = is_idempotent(request)
+        started_at = time.perf_counter()
+        attempt = 0
+
+        while True:
+            try:
+                response = self._transport.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # 连接没有建立，请求没有发出：任何方法都可以重试
+                reason, error = type(e).__name__, e
+            except (httpx.RemoteProtocolError, httpx.ReadError) as e:
+                # 连接在响应前被断开（如复用了已被服务端关闭的 keep-alive 连接）
+                if not idempotent:
+                    raise
+                reason, error = type(e).__name__, e
+            else:
+                if response.status_code not in RETRY_STATUSES or not idempotent:
+                    return response
+                reason, error = response.status_code, None
+
+            delay = backoff_delay(attempt)
+            elapsed = time.perf_counter() - started_at
+            if attempt >= DB_RETRY_ATTEMPTS or elapsed + delay > DB_RETRY_DEADLINE or not self._budget.withdraw():
+                if error is not None:
+                    raise error
+                return response
+            if error is None:
+                response.close()
+
+            attempt += 1
+            log = current_log()
+            log.set(db_retries=log.fields.get("db_retries", 0) + 1)
+            log.event("db_retry", method=request.method, path=request.url.path, reason=reason,
+                      attempt=attempt, delay_ms=round(delay * 1000, 2))
+            time.sleep(delay)
+
+    def close(self):
+        # 连接池由实例内所有客户端共享，不随单个 httpx.Client 关闭
+        pass
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def shared_transport():
+    """实例内唯一的连接池（第一次使用时创建）"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                pool = httpx.HTTPTransport(
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=DB_MAX_CONNECTIONS,
+                        max_keepalive_connections=DB_MAX_CONNECTIONS,
+                        keepalive_expiry=DB_KEEPALIVE_EXPIRY,
+                    ),
+                )
+                _transport = RetryTransport(pool, RetryBudget())
+    return _transport
+
+
+def request_timeout():
+    return httpx.Timeout(
+        connect=DB_CONNECT_TIMEOUT,
+        read=DB_READ_TIMEOUT,
+        write=DB_READ_TIMEOUT,
+        pool=DB_POOL_TIMEOUT,
+    )
+
+
+def build_http_client(**kwargs):
+    """使用共享连接池和超时配置的 httpx.Client"""
+    return httpx.Client(
+        transport=shared_transport(),
+        timeout=request_timeout(),
+        follow_redirects=True,
+        **kwargs,
+    )
+
+
+def configure_client(client):
+    """
+    让 supabase 客户端的 PostgREST 与 Auth 请求使用共享连接池
+    supabase-py 没有提供传入 httpx 客户端的选项，这里替换它内部创建的 session
+    """
+    postgrest = client.postgrest
+    session = postgrest.session
+    postgrest.session = build_http_client(base_url=session.base_url, headers=session.headers)
+    session.close()
+
+    # auth.admin 在创建时保存了同一个 httpx 客户端的引用，需要一起替换；
+    # 旧客户端随后关闭，仍在使用它的子 API 会报 "client has been closed"，这里提前检查
+    auth = client.auth
+    auth_session = auth._http_client
+    auth._http_client = auth.admin._http_client = build_http_client()
+    stale = [name for name, api in vars(auth).items() if getattr(api, "_http_client", None) is auth_session]
+    if stale:
+        raise RuntimeError(f"auth clients still use the replaced http client: {', '.join(stale)}")
+    auth_session.close()
+    return client
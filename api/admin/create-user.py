@@ -1,27 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http.server import BaseHTTPRequestHandler
+import contextvars
+import csv
+import io
 import json
 import os
 import logging
 
+from api._lib.db import get_admin_client
+from api._lib.http import send_body, start_streaming_response
+from api._lib.reqlog import RequestLogMixin, current_log
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
 ADMIN_SECRET = os.environ.get("ADMIN_SECRET", "")
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-supabase = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
+# 批量创建：单次请求最多创建的用户数、同时创建的用户数
+BULK_CREATE_MAX_USERS = int(os.environ.get("BULK_CREATE_MAX_USERS", "1000"))
+BULK_CREATE_CONCURRENCY = int(os.environ.get("BULK_CREATE_CONCURRENCY", "8"))
+
+
+class ProvisionError(Exception):
+    """创建单个用户失败（消息直接返回给调用方）"""
+
+
+def validate_user(username, password):
+    """返回错误消息，校验通过时返回 None"""
+    if not username or not password:
+        return '用户名和密码不能为空'
+    if not isinstance(username, str) or not isinstance(password, str):
+        return '用户名和密码必须是字符串'
+    if len(password) < 6:
+        return '密码至少 6 位'
+    return None
+
+
+def provision_user(supabase, username, password):
+    """
+    创建 Auth 用户，返回 (user_id, email)
+    用户资料由 on_auth_user_created 触发器根据 user_metadata 中的 username 在同一事务中创建：
+    资料写入失败（如用户名重复）时 Auth 用户也不会创建，这里不需要再写入或回滚
+    """
+    email = f"{username}@internal.local"
+
     try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-        logger.info("Supabase client initialized")
+        auth_response = supabase.auth.admin.create_user({
+            "email": email,
+            "password": password,
+            "email_confirm": True,
+            "user_metadata": {"username": username}
+        })
     except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-
+        current_log().error("create_auth_user_error", username=username, error=str(e))
+        raise ProvisionError(f'创建用户失败: {str(e)}')
+
+    if not auth_response.user:
+        raise ProvisionError('创建用户失败')
+    return auth_response.user.id, email
+
+
+def parse_bulk_users(content_type, body):
+    """
+    批量请求体 -> [(username, password)]
+    CSV 需要包含 username、password 两列（第一行为表头）；JSON 为对象数组
+    """
+    if 'csv' in content_type:
+        reader = csv.DictReader(io.StringIO(body))
+        if not reader.fieldnames or not {'username', 'password'} <= {name.strip() for name in reader.fieldnames}:
+            raise ValueError('CSV 需要包含 username 和 password 两列')
+        rows = [{key.strip(): value for key, value in row.items() if key} for row in reader]
+    else:
+        rows = json.loads(body)
+
+    users = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError('用户列表的每一项必须是对象')
+        username = row.get('username') or ''
+        users.append((username.strip() if isinstance(username, str) else username, row.get('password') or ''))
+    return users
+
+
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/admin/create-user"
 
-class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
@@ -37,72 +101,52 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response(403, '无权限访问')
                 return
 
-            # 读取请求体
+            # 读取请求体（utf-8-sig：兼容 Excel 导出的带 BOM 的 CSV）
             content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(body)
+            body = self.rfile.read(content_length).decode('utf-8-sig')
+            content_type = self.headers.get('Content-Type', '')
 
-            username = data.get('username')
-            password = data.get('password')
-
-            if not username or not password:
-                self.send_error_response(400, '用户名和密码不能为空')
+            # 批量模式：CSV 或 JSON 数组；单个模式：JSON 对象
+            is_csv = 'csv' in content_type
+            try:
+                data = None if is_csv else json.loads(body)
+            except json.JSONDecodeError:
+                self.send_error_response(400, '请求体不是有效的 JSON')
                 return
-
-            if len(password) < 6:
-                self.send_error_response(400, '密码至少 6 位')
+            if is_csv or isinstance(data, list):
+                try:
+                    users = parse_bulk_users(content_type, body)
+                except ValueError as e:
+                    self.send_error_response(400, str(e))
+                    return
+                self.create_users_bulk(users)
                 return
 
-            if not supabase:
-                self.send_error_response(500, 'Supabase 未初始化')
+            if not isinstance(data, dict):
+                self.send_error_response(400, '请求体必须是对象或数组')
                 return
 
-            # 1. 创建 Auth 用户
-            email = f"{username}@internal.local"
+            username = data.get('username')
+            password = data.get('password')
 
-            try:
-                auth_response = supabase.auth.admin.create_user({
-                    "email": email,
-                    "password": password,
-                    "email_confirm": True
-                })
-
-                if not auth_response.user:
-                    self.send_error_response(500, '创建用户失败')
-                    return
+            error_message = validate_user(username, password)
+            if error_message:
+                self.send_error_response(400, error_message)
+                return
 
-                user_id = auth_response.user.id
-            except Exception as e:
-                logger.error(f"Create auth user error: {e}")
-                self.send_error_response(500, f'创建用户失败: {str(e)}')
+            supabase = get_admin_client()
+            if not supabase:
+                self.send_error_response(500, 'Supabase 未初始化')
                 return
 
-            # 2. 创建用户资料
+            # 1. 创建 Auth 用户（用户资料由触发器创建）
             try:
-                profile_response = supabase.table('user_profiles').insert({
-                    'user_id': user_id,
-                    'username': username,
-                    'account_status': 'active',
-                    'risk_score': 0
-                }).execute()
-
-                if not profile_response.data:
-                    # 如果创建资料失败，删除 Auth 用户
-                    supabase.auth.admin.delete_user(user_id)
-                    self.send_error_response(500, '创建用户资料失败')
-                    return
-
-            except Exception as e:
-                logger.error(f"Create profile error: {e}")
-                # 删除 Auth 用户
-                try:
-                    supabase.auth.admin.delete_user(user_id)
-                except:
-                    pass
-                self.send_error_response(500, f'创建用户资料失败: {str(e)}')
+                user_id, email = provision_user(supabase, username, password)
+            except ProvisionError as e:
+                self.send_error_response(500, str(e))
                 return
 
-            # 3. 返回成功响应
+            # 2. 返回成功响应
             self.send_success_response({
                 'user_id': user_id,
                 'username': username,
@@ -111,25 +155,98 @@ class handler(BaseHTTPRequestHandler):
             })
 
         except Exception as e:
-            logger.error(f"Create user error: {e}")
+            self.request_log.error("create_user_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
+    def create_users_bulk(self, users):
+        """
+        批量创建用户：有限大小的线程池并发创建，每完成一个就输出一行 NDJSON 结果
+        每个用户独立成功或失败（on_auth_user_created 触发器在同一个事务中创建 Auth 用户和资料），最后一行为汇总
+        """
+        if not users:
+            self.send_error_response(400, '用户列表不能为空')
+            return
+        if len(users) > BULK_CREATE_MAX_USERS:
+            self.send_error_response(400, f'一次最多创建 {BULK_CREATE_MAX_USERS} 个用户')
+            return
+
+        supabase = get_admin_client()
+        if not supabase:
+            self.send_error_response(500, 'Supabase 未初始化')
+            return
+
+        # 先在本地校验（包括请求内重复的用户名，不区分大小写：Auth 邮箱不区分大小写），无效的行不调用 Supabase
+        results = []
+        pending = []
+        seen = set()
+        for index, (username, password) in enumerate(users):
+            error_message = validate_user(username, password)
+            if not error_message:
+                if username.lower() in seen:
+                    error_message = '用户名重复'
+                seen.add(username.lower())
+            if error_message:
+                results.append({'index': index, 'username': username, 'success': False, 'error': error_message})
+            else:
+                pending.append((index, username, password))
+
+        writer = start_streaming_response(
+            self, lambda: self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN),
+            content_type='application/x-ndjson; charset=utf-8'
+        )
+        self.request_log.set(bulk_total=len(users))
+        created = 0
+
+        def write_line(record):
+            writer.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            writer.flush()
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BULK_CREATE_CONCURRENCY, len(pending))),
+                                      thread_name_prefix="create-user")
+        try:
+            for record in results:
+                write_line(record)
+
+            # 每个任务复制一份上下文：请求日志在工作线程中仍可用
+            futures = {
+                executor.submit(contextvars.copy_context().run, provision_user, supabase, username, password):
+                    (index, username)
+                for index, username, password in pending
+            }
+            for future in as_completed(futures):
+                index, username = futures[future]
+                try:
+                    user_id, email = future.result()
+                except ProvisionError as e:
+                    write_line({'index': index, 'username': username, 'success': False, 'error': str(e)})
+                    continue
+                created += 1
+                write_line({'index': index, 'username': username, 'success': True,
+                            'user_id': user_id, 'email': email})
+
+            write_line({'summary': {'total': len(users), 'created': created, 'failed': len(users) - created}})
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开：不再开始新的创建，已开始的照常完成（每个用户的 Auth 用户和资料由触发器原子地创建）
+            self.request_log.event("bulk_client_disconnected", created=created)
+        except Exception as e:
+            self.request_log.error("bulk_create_failed", created=created, error=str(e))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.request_log.set(bulk_created=created, bulk_failed=len(users) - created)
+
     def send_success_response(self, data):
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
\ No newline at end of file
+        }, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
@@ -3,25 +3,20 @@ import json
 import os
 import logging
 
+from api._lib.db import get_admin_client
+from api._lib.http import send_body
+from api._lib.reqlog import RequestLogMixin
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
 ADMIN_SECRET = os.environ.get("ADMIN_SECRET", "")
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-supabase = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-        logger.info("Supabase client initialized")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
 
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/admin/reset-password"
 
-class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
@@ -55,6 +50,7 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response(400, '新密码至少 6 位')
                 return
 
+            supabase = get_admin_client()
             if not supabase:
                 self.send_error_response(500, 'Supabase 未初始化')
                 return
@@ -69,7 +65,7 @@ class handler(BaseHTTPRequestHandler):
 
                 user_id = profile_response.data['user_id']
             except Exception as e:
-                logger.error(f"Find user error: {e}")
+                self.request_log.error("find_user_error", error=str(e))
                 self.send_error_response(404, '用户不存在')
                 return
 
@@ -80,7 +76,7 @@ class handler(BaseHTTPRequestHandler):
                     {"password": new_password}
                 )
             except Exception as e:
-                logger.error(f"Reset password error: {e}")
+                self.request_log.error("reset_password_error", error=str(e))
                 self.send_error_response(500, f'重置密码失败: {str(e)}')
                 return
 
@@ -91,25 +87,21 @@ class handler(BaseHTTPRequestHandler):
             })
 
         except Exception as e:
-            logger.error(f"Reset password error: {e}")
+            self.request_log.error("reset_password_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
     def send_success_response(self, data):
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
\ No newline at end of file
+        }, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""
+单应用模式入口：所有 /api/* 路由由同一个 ASGI 应用处理（见 api/_lib/asgi.py）
+
+Vercel：在 vercel.json 中把 /api/(.*) 重写到 /api/app 即可启用
+本地：uvicorn api.app:app --port 3001
+"""
+from api._lib.asgi import app
+
+__all__ = ["app"]
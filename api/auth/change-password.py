@@ -3,24 +3,19 @@ import json
 import os
 import logging
 
+from api._lib.db import get_admin_client, get_auth_client
+from api._lib.http import send_body
+from api._lib.reqlog import RequestLogMixin
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-supabase = None
-if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-        logger.info("Supabase client initialized")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
 
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/auth/change-password"
 
-class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
@@ -53,6 +48,7 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response(400, '新密码不能与旧密码相同')
                 return
 
+            supabase = get_admin_client()
             if not supabase:
                 self.send_error_response(500, 'Supabase 未初始化')
                 return
@@ -60,7 +56,7 @@ class handler(BaseHTTPRequestHandler):
             # 1. 验证旧密码
             email = f"{username}@internal.local"
             try:
-                auth_response = supabase.auth.sign_in_with_password({
+                auth_response = get_auth_client().auth.sign_in_with_password({
                     "email": email,
                     "password": old_password
                 })
@@ -71,7 +67,7 @@ class handler(BaseHTTPRequestHandler):
 
                 user_id = auth_response.user.id
             except Exception as e:
-                logger.error(f"Auth error: {e}")
+                self.request_log.error("auth_error", error=str(e))
                 self.send_error_response(401, '旧密码错误')
                 return
 
@@ -82,7 +78,7 @@ class handler(BaseHTTPRequestHandler):
                     {"password": new_password}
                 )
             except Exception as e:
-                logger.error(f"Update password error: {e}")
+                self.request_log.error("update_password_error", error=str(e))
                 self.send_error_response(500, f'修改密码失败: {str(e)}')
                 return
 
@@ -92,25 +88,21 @@ class handler(BaseHTTPRequestHandler):
             })
 
         except Exception as e:
-            logger.error(f"Change password error: {e}")
+            self.request_log.error("change_password_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
     def send_success_response(self, data):
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
\ No newline at end of file
+        }, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
@@ -1,35 +1,29 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 import logging
 
+from api._lib.db import get_client
+from api._lib.http import send_body
+from api._lib.reqlog import RequestLogMixin
+from api._lib.sessions import needs_touch, status_cache, touch_buffer
+from api._lib.tokens import (
+    SESSION_TOKEN_TTL, is_expired, issue_token, session_denylist, token_last_seen, tokens_enabled, verify_token,
+)
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase 配置
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
-SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.environ.get("SUPABASE_KEY", "")
-
 # CORS 配置
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# 初始化 Supabase 客户端
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Supabase client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-else:
-    logger.warning("Supabase env vars missing")
 
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/auth/heartbeat"
 
-class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         """处理 CORS 预检请求"""
         self.send_response(200)
@@ -46,80 +40,150 @@ class handler(BaseHTTPRequestHandler):
             body = self.rfile.read(content_length).decode('utf-8')
             data = json.loads(body)
 
-            session_id = data.get('session_id')
+            # 携带会话令牌时以令牌中的会话 id 为准（旧客户端只传 session_id）
+            claims = None
+            if data.get('session_token') and tokens_enabled():
+                claims = verify_token(data['session_token'])
+                if claims is None:
+                    self.send_error_response(401, '会话令牌无效')
+                    return
+                session_id = claims['sid']
+            else:
+                session_id = data.get('session_id')
 
             if not session_id:
                 self.send_error_response(400, '会话ID不能为空')
                 return
 
             # 检查 Supabase 客户端
+            supabase = get_client()
             if not supabase:
                 self.send_error_response(500, 'Supabase 未初始化')
                 return
 
-            # 获取会话信息
-            session_response = supabase.table('user_sessions').select('user_id').eq('id', session_id).single().execute()
-
-            if not session_response.data:
-                self.send_error_response(404, '会话不存在')
-                return
-
-            user_id = session_response.data['user_id']
-
-            # 更新会话的 last_seen_at
-            supabase.table('user_sessions').update({
-                'last_seen_at': datetime.utcnow().isoformat()
-            }).eq('id', session_id).execute()
-
-            # 检查用户账号状态
-            profile_response = supabase.table('user_profiles').select('account_status').eq('user_id', user_id).single().execute()
-
-            if not profile_response.data:
+            if claims is not None:
+                if session_denylist.contains(session_id):
+                    self.send_success_response({
+                        'force_logout': True,
+                        'message': '会话已失效'
+                    })
+                    return
+
+                # 令牌未过期、账号状态没有变化：直接按令牌响应，不访问数据库
+                if self.token_is_current(supabase, claims):
+                    self.request_log.set(session_token="valid")
+                    self.touch_from_token(session_id, claims)
+                    self.send_success_response({
+                        'force_logout': False,
+                        'account_status': claims['st']
+                    })
+                    self.flush_touches(supabase)
+                    return
+                self.request_log.set(session_token="refresh")
+
+            # 读取会话与账号状态：旧客户端优先使用实例内缓存（全局状态版本号未变化时有效），
+            # 未命中或需要轮换令牌时一次数据库调用（见 database-user-profiles.sql 中的 heartbeat 函数）
+            session = status_cache.lookup(supabase, session_id) if claims is None else None
+            self.request_log.set(status_cache="hit" if session else "miss")
+
+            if session is None:
+                with self.request_log.timed("db_heartbeat"):
+                    heartbeat_response = supabase.rpc('heartbeat', {'p_session_id': session_id}).execute()
+
+                if not heartbeat_response.data:
+                    self.send_error_response(404, '会话不存在')
+                    return
+
+                session = heartbeat_response.data[0]
+                status_cache.store(session_id, session)
+
+            account_status = session['account_status']
+
+            if not account_status:
                 self.send_error_response(404, '用户不存在')
                 return
 
-            account_status = profile_response.data['account_status']
-
-            # 如果账号被封禁，强制登出
+            # 如果账号被封禁，强制登出（会话已由 heartbeat 函数置为失效）
             if account_status == 'banned':
-                supabase.table('user_sessions').update({
-                    'is_active': False
-                }).eq('id', session_id).execute()
-
                 self.send_success_response({
                     'force_logout': True,
                     'message': '您的账号已被封禁'
                 })
                 return
 
-            # 返回成功响应
-            self.send_success_response({
+            # 会话已被登出或被新登录踢下线：令牌不再轮换
+            if claims is not None and not session.get('is_active'):
+                session_denylist.add(session_id, time.time() + SESSION_TOKEN_TTL)
+                self.send_success_response({
+                    'force_logout': True,
+                    'message': '会话已失效'
+                })
+                return
+
+            # last_seen_at 已过期时记下本次心跳时间，稍后批量写回
+            now = datetime.now(timezone.utc)
+            last_seen_at = session['last_seen_at']
+            if needs_touch(last_seen_at, now):
+                touch_buffer.add(session_id, now)
+                status_cache.touched(session_id, now)
+                last_seen_at = now
+
+            # 返回成功响应（携带令牌时同时轮换出新令牌）
+            response_data = {
                 'force_logout': False,
                 'account_status': account_status
-            })
+            }
+            if claims is not None:
+                response_data['session_token'], response_data['token_expires_at'] = issue_token(
+                    session_id, session['user_id'], account_status, session['status_version'], last_seen_at
+                )
+            self.send_success_response(response_data)
+
+            self.flush_touches(supabase)
 
         except Exception as e:
-            logger.error(f"Heartbeat error: {e}")
+            self.request_log.error("heartbeat_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
+    def touch_from_token(self, session_id, claims):
+        """
+        令牌路径不读取数据库，按令牌中签发时的 last_seen_at 与本实例最近记下的时间判断是否需要写回，
+        否则令牌一直有效的会话 last_seen_at 不会前进
+        """
+        known = [seen_at for seen_at in (token_last_seen(claims), touch_buffer.last_added(session_id)) if seen_at]
+        now = datetime.now(timezone.utc)
+        if needs_touch(max(known) if known else None, now):
+            touch_buffer.add(session_id, now)
+
+    def flush_touches(self, supabase):
+        """响应发出后再批量写回到期的心跳时间，写回失败不影响本次心跳"""
+        if touch_buffer.due():
+            try:
+                touch_buffer.flush(supabase)
+            except Exception as e:
+                self.request_log.error("touch_flush_failed", pending=len(touch_buffer), error=str(e))
+
+    def token_is_current(self, supabase, claims):
+        """令牌未过期，且全局状态版本号没有超过签发时的版本号"""
+        if is_expired(claims) or claims.get('st') == 'banned' or not isinstance(claims.get('sv'), int):
+            return False
+        version = status_cache.current_version(supabase)
+        return version is not None and version <= claims['sv']
+
     def send_success_response(self, data):
         """发送成功响应"""
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         """发送错误响应"""
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
\ No newline at end of file
+        }, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
@@ -1,67 +1,25 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-from datetime import datetime, timedelta
 import logging
 
+from api._lib.db import get_auth_client, get_client
+from api._lib.fingerprint import best_match, encode_fingerprint, fetch_history, lsh_bands
+from api._lib.http import send_body
+from api._lib.reqlog import RequestLogMixin
+from api._lib.tokens import issue_token, tokens_enabled
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase 配置
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
-SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.environ.get("SUPABASE_KEY", "")
-
 # CORS 配置
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# 初始化 Supabase 客户端
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Supabase client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-else:
-    logger.warning("Supabase env vars missing")
-
-
-def calculate_fingerprint_similarity(fp1, fp2):
-    """
-    计算两个设备指纹的相似度（加权）
-    返回 0-1 之间的相似度分数
-    """
-    if not fp1 or not fp2:
-        return 0.0
-
-    weights = {
-        'canvas_hash': 0.3,
-        'audio_hash': 0.2,
-        'screen_width': 0.1,
-        'screen_height': 0.1,
-        'device_pixel_ratio': 0.05,
-        'platform': 0.1,
-        'browser_family': 0.05,
-        'browser_major': 0.05,
-        'timezone_offset': 0.05
-    }
-
-    total_score = 0.0
-    total_weight = 0.0
-
-    for key, weight in weights.items():
-        if key in fp1 and key in fp2:
-            total_weight += weight
-            if fp1[key] == fp2[key]:
-                total_score += weight
-
-    return total_score / total_weight if total_weight > 0 else 0.0
-
-
-class handler(BaseHTTPRequestHandler):
+
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/auth/login"
+
     def do_OPTIONS(self):
         """处理 CORS 预检请求"""
         self.send_response(200)
@@ -93,6 +51,7 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             # 检查 Supabase 客户端
+            supabase = get_client()
             if not supabase:
                 self.send_error_response(500, 'Supabase 未初始化')
                 return
@@ -101,10 +60,11 @@ class handler(BaseHTTPRequestHandler):
             try:
                 # 构造邮箱（username@internal.local）
                 email = f"{username}@internal.local"
-                auth_response = supabase.auth.sign_in_with_password({
-                    "email": email,
-                    "password": password
-                })
+                with self.request_log.timed("auth_sign_in"):
+                    auth_response = get_auth_client().auth.sign_in_with_password({
+                        "email": email,
+                        "password": password
+                    })
 
                 if not auth_response.user:
                     self.send_error_response(401, '用户名或密码错误')
@@ -112,135 +72,99 @@ class handler(BaseHTTPRequestHandler):
 
                 user_id = auth_response.user.id
             except Exception as e:
-                logger.error(f"Auth error: {e}")
+                self.request_log.error("auth_error", error=str(e))
                 self.send_error_response(401, '用户名或密码错误')
                 return
 
-            # 2. 获取用户资料
-            profile_response = supabase.table('user_profiles').select('*').eq('user_id', user_id).single().execute()
-
-            if not profile_response.data:
+            # 2. 与该用户的所有历史设备比较（按 Auth 返回的 user_id 读取，与输入用户名的大小写无关）
+            # 认证成功后才读取：登录失败和暴力破解不会产生 service_role 查询
+            fingerprint_vector = encode_fingerprint(fingerprint_raw)
+            history = self.fetch_history(supabase, user_id)
+            similarity = None
+            if history is not None:
+                similarity = best_match(fingerprint_vector, history)
+                self.request_log.set(history_sessions=len(history))
+
+            # 3. 会话轮换、风险评分和账号状态变更：数据库函数在一个事务中完成（见 database-user-profiles.sql）
+            with self.request_log.timed("db_login"):
+                login_response = supabase.rpc('login_with_fingerprint', {
+                    'p_user_id': user_id,
+                    'p_fingerprint_raw': fingerprint_raw,
+                    'p_fingerprint_hash': fingerprint_hash,
+                    'p_ip_address': self.headers.get('X-Forwarded-For', self.client_address[0]),
+                    'p_user_agent': self.headers.get('User-Agent', ''),
+                    'p_fingerprint_vector': fingerprint_vector,
+                    'p_similarity_score': similarity,
+                    'p_fingerprint_bands': lsh_bands(fingerprint_vector)
+                }).execute()
+
+            result = login_response.data[0] if login_response.data else None
+
+            if not result or result['result'] == 'not_found':
                 self.send_error_response(404, '用户资料不存在')
                 return
 
-            profile = profile_response.data
-
-            # 3. 检查账号状态
-            if profile['account_status'] == 'banned':
+            # 4. 检查账号状态
+            if result['result'] == 'banned':
                 self.send_error_response(403, '您的账号已被封禁，无法登录')
                 return
 
-            # 4. 查询活跃会话（15分钟内）
-            fifteen_min_ago = (datetime.utcnow() - timedelta(minutes=15)).isoformat()
-            active_sessions_response = supabase.table('user_sessions').select('*').eq('user_id', user_id).eq('is_active', True).gte('last_seen_at', fifteen_min_ago).execute()
-
-            active_sessions = active_sessions_response.data or []
-
-            # 5. 处理并发会话
-            risk_score_change = 0
-            similarity_score = 1.0
-
-            if active_sessions:
-                # 有活跃会话，计算指纹相似度
-                old_session = active_sessions[0]
-                old_fingerprint = old_session.get('fingerprint_raw', {})
-
-                similarity_score = calculate_fingerprint_similarity(old_fingerprint, fingerprint_raw)
-
-                if similarity_score < 0.5:
-                    # 指纹不相似，可能是账号共享
-                    risk_score_change = 15
-
-                    # 记录异常日志
-                    supabase.table('account_anomaly_logs').insert({
-                        'user_id': user_id,
-                        'event_type': 'concurrent_login_different_device',
-                        'details': {
-                            'old_fingerprint_hash': old_session.get('fingerprint_hash'),
-                            'new_fingerprint_hash': fingerprint_hash,
-                            'similarity_score': similarity_score
-                        },
-                        'risk_score_change': risk_score_change
-                    }).execute()
-
-                # 踢掉旧会话
-                supabase.table('user_sessions').update({
-                    'is_active': False,
-                    'kicked_reason': 'new_login'
-                }).eq('id', old_session['id']).execute()
-
-            # 6. 创建新会话
-            new_session_response = supabase.table('user_sessions').insert({
-                'user_id': user_id,
-                'fingerprint_raw': fingerprint_raw,
-                'fingerprint_hash': fingerprint_hash,
-                'ip_address': self.headers.get('X-Forwarded-For', self.client_address[0]),
-                'user_agent': self.headers.get('User-Agent', ''),
-                'is_active': True,
-                'similarity_score': similarity_score
-            }).execute()
-
-            new_session = new_session_response.data[0] if new_session_response.data else None
-
-            if not new_session:
+            if not result['session_id']:
                 self.send_error_response(500, '创建会话失败')
                 return
 
-            # 7. 更新用户资料
-            new_risk_score = profile['risk_score'] + risk_score_change
-            new_account_status = profile['account_status']
-
-            # 根据风险分数调整账号状态
-            if new_risk_score >= 70:
-                new_account_status = 'banned'
-            elif new_risk_score >= 40:
-                new_account_status = 'limited'
-            else:
-                new_account_status = 'active'
-
-            supabase.table('user_profiles').update({
-                'last_login_at': datetime.utcnow().isoformat(),
-                'risk_score': new_risk_score,
-                'account_status': new_account_status,
-                'status_updated_at': datetime.utcnow().isoformat() if new_account_status != profile['account_status'] else profile.get('status_updated_at')
-            }).eq('user_id', user_id).execute()
-
-            # 8. 返回成功响应
+            self.request_log.set(similarity_score=result['similarity_score'], shared_accounts=result['shared_accounts'])
+
+            session = {
+                'id': result['session_id'],
+                'created_at': result['session_created_at']
+            }
+
+            # 5. 签发会话令牌（心跳在内存中校验，见 api/_lib/tokens.py）
+            if tokens_enabled():
+                session['token'], session['token_expires_at'] = issue_token(
+                    result['session_id'], user_id, result['account_status'], result['status_version'],
+                    result['session_created_at']
+                )
+
+            # 6. 返回成功响应
             self.send_success_response({
                 'user': {
                     'id': user_id,
-                    'username': profile['username'],
-                    'account_status': new_account_status,
-                    'risk_score': new_risk_score
+                    'username': result['username'],
+                    'account_status': result['account_status'],
+                    'risk_score': result['risk_score']
                 },
-                'session': {
-                    'id': new_session['id'],
-                    'created_at': new_session['created_at']
-                }
+                'session': session
             })
 
         except Exception as e:
-            logger.error(f"Login error: {e}")
+            self.request_log.error("login_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
+    def fetch_history(self, supabase, user_id):
+        """读取历史指纹；失败时返回 None，由数据库函数与最近的活跃会话比较"""
+        try:
+            with self.request_log.timed("db_history"):
+                return fetch_history(supabase, user_id)
+        except Exception as e:
+            self.request_log.error("history_failed", error=str(e))
+            return None
+
     def send_success_response(self, data):
         """发送成功响应"""
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         """发送错误响应"""
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
@@ -1,35 +1,27 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import time
 from datetime import datetime
 import logging
 
+from api._lib.db import get_client
+from api._lib.http import send_body
+from api._lib.reqlog import RequestLogMixin
+from api._lib.sessions import status_cache
+from api._lib.tokens import SESSION_TOKEN_TTL, session_denylist, verify_token
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase 配置
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
-SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.environ.get("SUPABASE_KEY", "")
-
 # CORS 配置
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# 初始化 Supabase 客户端
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Supabase client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-else:
-    logger.warning("Supabase env vars missing")
 
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/auth/logout"
 
-class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         """处理 CORS 预检请求"""
         self.send_response(200)
@@ -48,16 +40,24 @@ class handler(BaseHTTPRequestHandler):
 
             session_id = data.get('session_id')
 
+            # 携带会话令牌时以令牌中的会话 id 为准，并加入本实例的撤销名单（令牌过期前心跳即被拒绝）
+            claims = verify_token(data.get('session_token'))
+            if claims is not None:
+                session_id = claims['sid']
+                session_denylist.add(session_id, time.time() + SESSION_TOKEN_TTL)
+
             if not session_id:
                 self.send_error_response(400, '会话ID不能为空')
                 return
 
             # 检查 Supabase 客户端
+            supabase = get_client()
             if not supabase:
                 self.send_error_response(500, 'Supabase 未初始化')
                 return
 
-            # 更新会话状态
+            # 更新会话状态（同时清除本实例缓存的会话状态）
+            status_cache.entries.invalidate(session_id)
             supabase.table('user_sessions').update({
                 'is_active': False,
                 'last_seen_at': datetime.utcnow().isoformat()
@@ -67,27 +67,23 @@ class handler(BaseHTTPRequestHandler):
             self.send_success_response({'message': '登出成功'})
 
         except Exception as e:
-            logger.error(f"Logout error: {e}")
+            self.request_log.error("logout_error", error=str(e))
             self.send_error_response(500, f'服务器错误: {str(e)}')
 
     def send_success_response(self, data):
         """发送成功响应"""
         self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': True,
             'data': data
-        }).encode('utf-8'))
+        }, ensure_ascii=False).encode('utf-8'))
 
     def send_error_response(self, status_code, error_message):
         """发送错误响应"""
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        send_body(self, json.dumps({
             'success': False,
             'error': error_message
-        }).encode('utf-8'))
\ No newline at end of file
+        }, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
@@ -5,45 +5,72 @@ import os
 from datetime import datetime, timedelta
 import logging
 
+from api._lib.cache import TTLCache
+from api._lib.db import is_configured, require_client
+from api._lib.reqlog import RequestLogMixin, current_log
+from api._lib.feed import (
+    decode_cursor,
+    encode_position,
+    encode_watermark,
+    VIEW_KEYS,
+    feed_shape,
+    paginate,
+    public_post,
+    query_changes,
+    query_feed_page,
+    serialize_feed,
+    summarize_post,
+    tombstone_reason,
+)
+from api._lib.http import (
+    JsonPayload,
+    compute_etag,
+    etag_for_encoding,
+    format_http_date,
+    is_not_modified,
+    negotiate_encoding,
+    send_body,
+    start_streaming_response,
+)
+from api._lib.snapshot import FEED_SNAPSHOT_SIZE, get_feed_snapshot
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase 配置
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
-# 优先使用 service_role key（服务端安全），否则使用 anon key
-SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.environ.get("SUPABASE_KEY", "")
 IS_DEVELOPMENT = os.environ.get("VERCEL_ENV") != "production"
 
 # CORS 配置（默认允许所有来源，生产环境应设置为具体域名）
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# 初始化 Supabase 客户端
-supabase = None
-logger.info({
-    "event": "env_loaded",
-    "has_url": bool(SUPABASE_URL),
-    "has_service_role": bool(SUPABASE_SERVICE_ROLE_KEY),
-    "vercel_env": os.environ.get("VERCEL_ENV"),
-})
-print("[posts.py] Env loaded:", json.dumps({
-    "has_url": bool(SUPABASE_URL),
-    "has_service_role": bool(SUPABASE_SERVICE_ROLE_KEY),
-    "vercel_env": os.environ.get("VERCEL_ENV"),
-}))
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Supabase client initialized successfully")
-        print("[posts.py] Supabase client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-        print(f"[posts.py] Failed to initialize Supabase: {e}")
-else:
-    logger.warning("Supabase env vars missing, unable to initialize client")
-    print("[posts.py] Supabase env vars missing, client not initialized")
+# 分页配置：默认每页条数与单页上限
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+# 增量同步（?since=）默认每次最多返回的变更条数
+DEFAULT_CHANGES_PAGE_SIZE = 200
+
+# limit 超过该值且缓存未命中时，改为流式输出：分批查询数据库，逐条序列化并以 chunked 编码写出，
+# 内存占用和首字节时间不随 limit 增长
+POSTS_STREAM_THRESHOLD = int(os.environ.get("POSTS_STREAM_THRESHOLD", "200"))
+# 流式输出时每次从数据库读取的条数
+STREAM_FETCH_SIZE = 200
+
+# 列表缓存配置（秒）：TTL 内直接命中；过期后 STALE_TTL 内先返回旧数据并在后台刷新一次
+# POSTS_CACHE_TTL=0 可关闭缓存
+POSTS_CACHE_TTL = float(os.environ.get("POSTS_CACHE_TTL", "30"))
+POSTS_CACHE_STALE_TTL = float(os.environ.get("POSTS_CACHE_STALE_TTL", "300"))
+POSTS_CACHE_MAX_ENTRIES = int(os.environ.get("POSTS_CACHE_MAX_ENTRIES", "256"))
+
+# 浏览器缓存策略：允许缓存，但每次使用前都必须用 ETag / Last-Modified 向服务端确认
+POSTS_CACHE_CONTROL = os.environ.get("POSTS_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+
+# 模块级缓存：在同一个热实例的多次调用之间共享
+feed_cache = TTLCache(
+    ttl=POSTS_CACHE_TTL,
+    stale_ttl=POSTS_CACHE_STALE_TTL,
+    max_entries=POSTS_CACHE_MAX_ENTRIES,
+    name="posts",
+)
 
 
 def get_fake_posts():
@@ -68,6 +95,7 @@ def get_fake_posts():
             "content": content,
             "image_path": None,
             "created_at": (base_time - timedelta(hours=len(fake_contents) - i)).isoformat() + 'Z',
+            "updated_at": (base_time - timedelta(hours=len(fake_contents) - i)).isoformat() + 'Z',
         }
         for i, content in enumerate(fake_contents)
     ]
@@ -75,6 +103,64 @@ def get_fake_posts():
     return fake_posts
 
 
+def paginate_fake_posts(limit, cursor_position, view="full"):
+    """对假数据应用与数据库查询相同的 (created_at, id) 倒序 keyset 分页"""
+    posts = sorted(get_fake_posts(), key=lambda p: (p["created_at"], p["id"]), reverse=True)
+    if cursor_position:
+        posts = [p for p in posts if (p["created_at"], p["id"]) < cursor_position]
+    if view == "summary":
+        posts = [summarize_post(p) for p in posts]
+    return paginate(posts[:limit + 1], limit)
+
+
+def load_feed_page(limit, cursor_position, view):
+    """查询一页帖子，并记录当前缓存命中情况"""
+    result = query_feed_page(require_client(), limit, cursor_position, view)
+    current_log().set(cache=feed_cache.stats)
+    return result
+
+
+def load_latest_page(view):
+    """首页：读取预先生成的快照（一次主键查询），快照缺失时才实时查询"""
+    payload = get_feed_snapshot(require_client(), FEED_SNAPSHOT_SIZE, view)
+    current_log().set(cache=feed_cache.stats)
+    return payload
+
+
+def load_changes(limit, since_position, view):
+    """查询增量变更，并记录当前缓存命中情况"""
+    result = query_changes(require_client(), limit, since_position, view)
+    current_log().set(cache=feed_cache.stats)
+    return result
+
+
+def serialize_changes(rows, has_more, since, shape="", view="full"):
+    """
+    把增量结果序列化为 JsonPayload
+    data 为新增/修改后的可见帖子，tombstones 为需要从本地移除的帖子
+    """
+    posts = []
+    tombstones = []
+    for row in rows:
+        reason = tombstone_reason(row)
+        if reason:
+            tombstones.append({"id": row["id"], "reason": reason})
+        else:
+            posts.append(public_post(row, view))
+
+    watermark = encode_watermark(rows[-1]) if rows else since
+    response_data = {
+        "success": True,
+        "count": len(posts),
+        "data": posts,
+        "tombstones": tombstones,
+        "watermark": watermark,
+        "has_more": has_more
+    }
+    body = json.dumps(response_data, ensure_ascii=False).encode()
+    return JsonPayload(body, etag=compute_etag(shape, watermark, has_more))
+
+
 def send_security_headers(handler_instance):
     """添加安全响应头"""
     handler_instance.send_header('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload')
@@ -84,113 +170,204 @@ def send_security_headers(handler_instance):
     handler_instance.send_header('Permissions-Policy', 'camera=(), microphone=(), geolocation=(), interest-cohort=()')
 
 
-class handler(BaseHTTPRequestHandler):
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/posts"
+
     def do_GET(self):
         # 解析查询参数
         parsed_url = urlparse(self.path)
         query_params = parse_qs(parsed_url.query)
 
+        # ?since=<watermark> 为增量同步请求，只返回水位线之后变化的帖子
+        since = query_params.get('since', [None])[0]
+        default_limit = DEFAULT_CHANGES_PAGE_SIZE if since else DEFAULT_PAGE_SIZE
+
         # 验证 limit 参数
         try:
-            limit = int(query_params.get('limit', [100])[0])
-            limit = min(max(limit, 1), 1000)  # 限制在 1-1000 之间
+            limit = int(query_params.get('limit', [default_limit])[0])
+            limit = min(max(limit, 1), MAX_PAGE_SIZE)  # 限制在 1-MAX_PAGE_SIZE 之间
         except (ValueError, IndexError):
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-            send_security_headers(self)
-            self.end_headers()
-            error_response = {
-                "success": False,
-                "error": "Invalid limit parameter"
-            }
-            self.wfile.write(json.dumps(error_response).encode())
+            self.send_bad_request("Invalid limit parameter")
             return
 
+        # 验证 cursor 参数（上一页响应中的 next_cursor）
+        cursor = query_params.get('cursor', [None])[0]
         try:
-            posts = []
-
-            # 如果配置了 Supabase，从数据库获取数据
-            if supabase:
-                try:
-                    logger.info({
-                        "event": "supabase_query_start",
-                        "table": "gold_signals",
-                        "limit": limit,
-                    })
-                    print("[posts.py] Supabase query start", json.dumps({"table": "gold_signals", "limit": limit}))
-
-                    # 只选择前端需要的字段，不暴露内部字段
-                    response = supabase.table('gold_signals') \
-                        .select('id, content, image_path, created_at') \
-                        .eq('is_filtered', False) \
-                        .is_('deleted_at', 'null') \
-                        .eq('status', 'published') \
-                        .order('created_at', desc=True) \
-                        .limit(limit) \
-                        .execute()
-
-                    response_data = response.data if response and response.data else []
-                    response_error = getattr(response, "error", None)
-                    logger.info({
-                        "event": "supabase_query_result",
-                        "count": len(response_data),
-                        "error": response_error,
-                    })
-                    print("[posts.py] Supabase query result", json.dumps({
-                        "count": len(response_data),
-                        "error": response_error,
-                        "preview": response_data[:2],
-                    }, default=str))
-                    if response_error:
-                        logger.error({"event": "supabase_query_error", "error": response_error})
-                        print("[posts.py] Supabase query error", response_error)
-
-                    if response_data:
-                        posts = response_data
-                except Exception as db_error:
-                    logger.error(f"Database query failed: {db_error}")
-                    print(f"[posts.py] Database query failed: {db_error}")
-                    # 数据库错误时，如果是开发环境则返回假数据，生产环境返回空数组
-                    if IS_DEVELOPMENT:
-                        posts = get_fake_posts()
-
-            # 如果没有配置 Supabase 且是开发环境，返回假数据
-            elif IS_DEVELOPMENT:
-                posts = get_fake_posts()
+            cursor_position = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            self.send_bad_request("Invalid cursor parameter")
+            return
+
+        # 验证 since 参数（上一次响应中的 watermark）
+        try:
+            since_position = decode_cursor(since) if since else None
+        except ValueError:
+            self.send_bad_request("Invalid since parameter")
+            return
+
+        # 验证 view 参数：full 返回全文，summary 只返回摘要和标记
+        view = query_params.get('view', ['full'])[0]
+        if view not in VIEW_KEYS:
+            self.send_bad_request("Invalid view parameter")
+            return
+
+        try:
+            if since:
+                shape = f"changes:{limit}:{since}:{view}"
+                payload, cache_status = self.load_payload(
+                    ("changes", limit, since, view),
+                    lambda: serialize_changes(*load_changes(limit, since_position, view), since, shape, view),
+                    # 无法查询时视为没有变更，原样返回水位线
+                    lambda: serialize_changes([], False, since, shape, view),
+                )
+            else:
+                # 大页面且本实例没有缓存：流式输出，不在内存中拼出完整响应
+                if (is_configured() and limit > POSTS_STREAM_THRESHOLD
+                        and feed_cache.get(("feed", limit, cursor, view)) is None
+                        and self.stream_feed(limit, cursor_position, view)):
+                    return
+
+                shape = feed_shape(limit, cursor, view)
+                if not cursor and limit == FEED_SNAPSHOT_SIZE:
+                    load = lambda: load_latest_page(view)
+                else:
+                    load = lambda: serialize_feed(*load_feed_page(limit, cursor_position, view), shape)
+                payload, cache_status = self.load_payload(
+                    ("feed", limit, cursor, view),
+                    load,
+                    # 开发环境返回假数据，生产环境返回空数组
+                    lambda: serialize_feed(
+                        *(paginate_fake_posts(limit, cursor_position, view) if IS_DEVELOPMENT else ([], None)),
+                        shape,
+                    ),
+                )
+
+            # 客户端缓存仍然有效：返回不带响应体的 304
+            if is_not_modified(self.headers, payload.etag, payload.last_modified):
+                encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), len(payload.body))
+                self.send_response(304)
+                self.send_feed_headers(payload, cache_status)
+                self.send_header('Vary', 'Accept-Encoding')
+                self.send_header('ETag', etag_for_encoding(payload.etag, encoding))
+                self.end_headers()
+                return
 
             # 设置响应头
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', '*')
-            send_security_headers(self)
-            self.end_headers()
+            self.send_feed_headers(payload, cache_status)
 
-            # 返回 JSON 响应
-            response_data = {
-                "success": True,
-                "count": len(posts),
-                "data": posts
-            }
-            self.wfile.write(json.dumps(response_data).encode())
+            # 返回 JSON 响应（按 Accept-Encoding 压缩，缓存命中时复用已压缩的字节）
+            send_body(self, payload)
 
         except Exception as e:
             # 记录错误但不暴露详细信息给客户端
-            logger.error(f"Unexpected error in /api/posts: {e}")
+            self.request_log.error("unexpected_error", error=str(e))
 
             self.send_response(500)
-            self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
             send_security_headers(self)
-            self.end_headers()
 
             error_response = {
                 "success": False,
                 "error": "Internal server error"
             }
-            self.wfile.write(json.dumps(error_response).encode())
+            send_body(self, json.dumps(error_response).encode())
+
+    def stream_feed(self, limit, cursor_position, view):
+        """
+        流式输出一页较大的帖子列表
+        先同步读取第一批数据：失败时返回 False，交给常规路径处理（假数据 / 空数组）；
+        开始输出之后再出错只能中断连接，客户端会收到不完整的响应而不是错误的数据
+        """
+        try:
+            supabase = require_client()
+            batch, batch_cursor = query_feed_page(supabase, min(STREAM_FETCH_SIZE, limit), cursor_position, view)
+        except Exception as db_error:
+            self.request_log.error("db_query_failed", error=str(db_error))
+            return False
+
+        writer = start_streaming_response(self, lambda: self.send_feed_headers(None, "BYPASS"))
+        self.request_log.set(streamed=True)
+        sent = 0
+        newest = None
+        try:
+            writer.write(b'{"success": true, "data": [')
+            while True:
+                for post in batch:
+                    prefix = b',' if sent else b''
+                    writer.write(prefix + json.dumps(post, ensure_ascii=False).encode())
+                    sent += 1
+                    position = (post.get("updated_at") or post["created_at"], post["id"])
+                    if newest is None or position > newest:
+                        newest = position
+                # 每批数据写完就推给客户端
+                writer.flush()
+
+                if not batch_cursor or sent >= limit:
+                    break
+                batch, batch_cursor = query_feed_page(
+                    supabase, min(STREAM_FETCH_SIZE, limit - sent), decode_cursor(batch_cursor), view
+                )
+                if not batch:
+                    break
+
+            next_cursor = batch_cursor if sent >= limit else None
+            tail = {
+                "count": sent,
+                "next_cursor": next_cursor,
+                "watermark": encode_position(*newest) if newest else None,
+            }
+            # 去掉 "{" 与已输出的对象拼接成一个完整的 JSON
+            writer.write(b'], ' + json.dumps(tail, ensure_ascii=False).encode()[1:])
+            writer.close()
+            self.request_log.set(count=sent)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.request_log.error("stream_failed", sent=sent, error=str(e))
+        return True
+
+    def load_payload(self, cache_key, load, fallback):
+        """
+        按 缓存 -> 数据库 -> fallback 的顺序获取响应
+        返回 (payload, cache_status)，未走缓存时 cache_status 为 None
+        """
+        # 如果配置了 Supabase，从数据库获取数据（同一实例内按查询形状缓存序列化结果）
+        # 客户端在缓存未命中、真正需要查询时才创建
+        if is_configured():
+            try:
+                payload, cache_status = feed_cache.get_or_load(cache_key, load)
+                self.request_log.set(cache_status=cache_status)
+                return payload, cache_status
+            except Exception as db_error:
+                self.request_log.error("db_query_failed", error=str(db_error))
+
+        # 数据库错误或未配置 Supabase
+        return fallback(), None
+
+    def send_feed_headers(self, payload, cache_status):
+        """200 与 304 共用的响应头（CORS、Last-Modified、安全头）；ETag 随协商后的编码发送"""
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified, X-Cache')
+        self.send_header('Cache-Control', POSTS_CACHE_CONTROL)
+        if payload is not None and payload.last_modified:
+            self.send_header('Last-Modified', format_http_date(payload.last_modified))
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
+        send_security_headers(self)
+
+    def send_bad_request(self, message):
+        """返回 400 参数错误"""
+        self.send_response(400)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        send_security_headers(self)
+        error_response = {
+            "success": False,
+            "error": message
+        }
+        send_body(self, json.dumps(error_response).encode())
 
     def do_OPTIONS(self):
         # 处理 CORS 预检请求
@@ -0,0 +1,138 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import json
+import os
+import logging
+
+from api._lib.cache import TTLCache
+from api._lib.db import is_configured, require_client
+from api._lib.feed import public_post, query_post
+from api._lib.http import (
+    JsonPayload,
+    compute_etag,
+    etag_for_encoding,
+    format_http_date,
+    is_not_modified,
+    negotiate_encoding,
+    parse_timestamp,
+    send_body,
+)
+from api._lib.reqlog import RequestLogMixin
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# CORS 配置（默认允许所有来源，生产环境应设置为具体域名）
+ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
+
+# 单条帖子缓存（秒）：帖子很少修改，按 id 缓存全文；POST_CACHE_TTL=0 可关闭
+POST_CACHE_TTL = float(os.environ.get("POST_CACHE_TTL", "60"))
+POST_CACHE_STALE_TTL = float(os.environ.get("POST_CACHE_STALE_TTL", "600"))
+POST_CACHE_MAX_ENTRIES = int(os.environ.get("POST_CACHE_MAX_ENTRIES", "512"))
+
+# 浏览器缓存策略：短时间内直接使用，之后用 ETag 校验
+POST_CACHE_CONTROL = os.environ.get("POST_CACHE_CONTROL", "public, max-age=60")
+
+# 模块级缓存：值为 JsonPayload，帖子不存在时为 None（同样缓存，避免反复查询）
+post_cache = TTLCache(
+    ttl=POST_CACHE_TTL,
+    stale_ttl=POST_CACHE_STALE_TTL,
+    max_entries=POST_CACHE_MAX_ENTRIES,
+    name="post",
+)
+
+
+def send_security_headers(handler_instance):
+    """添加安全响应头"""
+    handler_instance.send_header('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload')
+    handler_instance.send_header('X-Frame-Options', 'DENY')
+    handler_instance.send_header('X-Content-Type-Options', 'nosniff')
+    handler_instance.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
+    handler_instance.send_header('Permissions-Policy', 'camera=(), microphone=(), geolocation=(), interest-cohort=()')
+
+
+def load_post(post_id):
+    """查询一条帖子并序列化为 JsonPayload，不存在时返回 None"""
+    row = query_post(require_client(), post_id)
+    if row is None:
+        return None
+    post = public_post(row)
+    updated_at = post.get("updated_at") or post["created_at"]
+    body = json.dumps({"success": True, "data": post}, ensure_ascii=False).encode()
+    return JsonPayload(body, etag=compute_etag("post", post["id"], updated_at), last_modified=parse_timestamp(updated_at))
+
+
+def parse_post_id(path):
+    """从 /api/posts/{id} 中解析帖子 id，不合法时返回 None"""
+    segment = urlparse(path).path.rstrip('/').rsplit('/', 1)[-1]
+    if not segment.isdigit():
+        return None
+    post_id = int(segment)
+    return post_id if post_id > 0 else None
+
+
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/posts/[id]"
+
+    def do_GET(self):
+        """GET /api/posts/{id}：单条帖子全文（摘要视图的列表打开详情时使用）"""
+        post_id = parse_post_id(self.path)
+        if post_id is None:
+            self.send_error_response(400, "Invalid post id")
+            return
+
+        if not is_configured():
+            self.send_error_response(503, "Service unavailable")
+            return
+
+        try:
+            payload, cache_status = post_cache.get_or_load(post_id, lambda: load_post(post_id))
+        except Exception as e:
+            self.request_log.error("db_query_failed", post_id=post_id, error=str(e))
+            self.send_error_response(500, "Internal server error")
+            return
+
+        self.request_log.set(post_id=post_id, cache_status=cache_status)
+        if payload is None:
+            self.send_error_response(404, "Post not found")
+            return
+
+        # 客户端缓存仍然有效：返回不带响应体的 304
+        if is_not_modified(self.headers, payload.etag, payload.last_modified):
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), len(payload.body))
+            self.send_response(304)
+            self.send_post_headers(payload, cache_status)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('ETag', etag_for_encoding(payload.etag, encoding))
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_post_headers(payload, cache_status)
+        send_body(self, payload)
+
+    def send_post_headers(self, payload, cache_status):
+        """200 与 304 共用的响应头"""
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified, X-Cache')
+        self.send_header('Cache-Control', POST_CACHE_CONTROL)
+        if payload.last_modified:
+            self.send_header('Last-Modified', format_http_date(payload.last_modified))
+        self.send_header('X-Cache', cache_status)
+        send_security_headers(self)
+
+    def send_error_response(self, status_code, message):
+        self.send_response(status_code)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        send_security_headers(self)
+        send_body(self, json.dumps({"success": False, "error": message}).encode())
+
+    def do_OPTIONS(self):
+        # 处理 CORS 预检请求
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        send_security_headers(self)
+        self.end_headers()
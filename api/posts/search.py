@@ -0,0 +1,147 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+import json
+import os
+import logging
+
+from api._lib.cache import TTLCache
+from api._lib.db import is_configured, require_client
+from api._lib.http import (
+    JsonPayload,
+    compute_etag,
+    etag_for_encoding,
+    is_not_modified,
+    negotiate_encoding,
+    send_body,
+)
+from api._lib.reqlog import RequestLogMixin
+from api._lib.search import decode_search_cursor, is_searchable, normalize_query, query_search_page
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# CORS 配置（默认允许所有来源，生产环境应设置为具体域名）
+ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
+
+# 分页配置：默认每页条数与单页上限
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+# 搜索结果缓存（秒）：热门关键词在同一实例内直接复用结果，SEARCH_CACHE_TTL=0 可关闭
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "256"))
+
+search_cache = TTLCache(ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES, name="search")
+
+
+def send_security_headers(handler_instance):
+    """添加安全响应头"""
+    handler_instance.send_header('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload')
+    handler_instance.send_header('X-Frame-Options', 'DENY')
+    handler_instance.send_header('X-Content-Type-Options', 'nosniff')
+    handler_instance.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
+    handler_instance.send_header('Permissions-Policy', 'camera=(), microphone=(), geolocation=(), interest-cohort=()')
+
+
+def serialize_results(query, posts, next_cursor):
+    """把一页搜索结果序列化为 JsonPayload"""
+    response_data = {
+        "success": True,
+        "query": query,
+        "count": len(posts),
+        "data": posts,
+        "next_cursor": next_cursor
+    }
+    body = json.dumps(response_data, ensure_ascii=False).encode()
+    return JsonPayload(body, etag=compute_etag("search", query, ",".join(str(p["id"]) for p in posts), next_cursor))
+
+
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/posts/search"
+
+    def do_GET(self):
+        """GET /api/posts/search?q=<关键词>&limit=&cursor=：按相关度排序的全文搜索"""
+        query_params = parse_qs(urlparse(self.path).query)
+
+        # 验证 q 参数
+        try:
+            query = normalize_query(query_params.get('q', [''])[0])
+        except ValueError as e:
+            self.send_error_response(400, str(e))
+            return
+        if not query:
+            self.send_error_response(400, "Missing search query")
+            return
+
+        # 验证 limit 参数
+        try:
+            limit = int(query_params.get('limit', [DEFAULT_PAGE_SIZE])[0])
+            limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        except (ValueError, IndexError):
+            self.send_error_response(400, "Invalid limit parameter")
+            return
+
+        # 验证 cursor 参数（上一页响应中的 next_cursor）
+        cursor = query_params.get('cursor', [None])[0]
+        try:
+            cursor_position = decode_search_cursor(cursor) if cursor else None
+        except ValueError:
+            self.send_error_response(400, "Invalid cursor parameter")
+            return
+
+        self.request_log.set(query_length=len(query), limit=limit, paged=bool(cursor))
+
+        # 没有可检索的字符（如纯标点）：直接返回空结果
+        if not is_searchable(query):
+            self.send_payload(serialize_results(query, [], None))
+            return
+
+        if not is_configured():
+            self.send_error_response(503, "Search unavailable")
+            return
+
+        try:
+            payload, cache_status = search_cache.get_or_load(
+                (query.lower(), limit, cursor),
+                lambda: serialize_results(query, *query_search_page(require_client(), query, limit, cursor_position)),
+            )
+            self.request_log.set(cache_status=cache_status)
+            self.send_payload(payload, cache_status)
+        except Exception as e:
+            self.request_log.error("search_failed", error=str(e))
+            self.send_error_response(500, "Internal server error")
+
+    def send_payload(self, payload, cache_status=None):
+        """返回搜索结果；客户端缓存仍然有效时返回 304"""
+        not_modified = is_not_modified(self.headers, payload.etag, None)
+        self.send_response(304 if not_modified else 200)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Expose-Headers', 'ETag, X-Cache')
+        self.send_header('Cache-Control', 'public, max-age=0, must-revalidate')
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
+        send_security_headers(self)
+
+        if not_modified:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), len(payload.body))
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('ETag', etag_for_encoding(payload.etag, encoding))
+            self.end_headers()
+            return
+        send_body(self, payload)
+
+    def send_error_response(self, status_code, message):
+        self.send_response(status_code)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        send_security_headers(self)
+        send_body(self, json.dumps({"success": False, "error": message}).encode())
+
+    def do_OPTIONS(self):
+        # 处理 CORS 预检请求
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        send_security_headers(self)
+        self.end_headers()
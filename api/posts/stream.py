@@ -0,0 +1,162 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+import json
+import os
+import queue
+import time
+import logging
+
+from api._lib.broadcast import FeedBroadcaster, event_position, row_to_event
+from api._lib.feed import query_changes, query_latest_watermark
+from api._lib.db import get_client, require_client
+from api._lib.reqlog import RequestLogMixin
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# CORS 配置（默认允许所有来源，生产环境应设置为具体域名）
+ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
+
+# SSE 配置（秒）
+# 上游轮询间隔：每个实例只有一个轮询线程，与连接数无关
+SSE_POLL_INTERVAL = float(os.environ.get("SSE_POLL_INTERVAL", "3"))
+# 心跳注释间隔：防止代理因空闲断开连接
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT_INTERVAL", "15"))
+# 单个连接的最长持续时间：到时主动结束，浏览器按 retry 自动重连并带上 Last-Event-ID
+SSE_MAX_DURATION = float(os.environ.get("SSE_MAX_DURATION", "25"))
+# 客户端重连等待时间（毫秒）
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+# 断线补发时最多查询的变更条数
+SSE_CATCH_UP_LIMIT = 200
+
+
+# 模块级广播器：同一个热实例上的所有 SSE 连接共享一个上游轮询
+broadcaster = FeedBroadcaster(
+    fetch_changes=lambda since_position: query_changes(require_client(), SSE_CATCH_UP_LIMIT, since_position),
+    fetch_latest=lambda: query_latest_watermark(require_client()),
+    poll_interval=SSE_POLL_INTERVAL,
+)
+
+
+def send_security_headers(handler_instance):
+    """添加安全响应头"""
+    handler_instance.send_header('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload')
+    handler_instance.send_header('X-Frame-Options', 'DENY')
+    handler_instance.send_header('X-Content-Type-Options', 'nosniff')
+    handler_instance.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
+    handler_instance.send_header('Permissions-Policy', 'camera=(), microphone=(), geolocation=(), interest-cohort=()')
+
+
+def format_event(event_id, event_type, data):
+    """格式化为一条 SSE 消息（data 为单行 JSON）"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode()
+
+
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/posts/stream"
+
+    def do_GET(self):
+        """GET /api/posts/stream：以 Server-Sent Events 推送新发布、修改和删除的帖子"""
+        supabase = get_client()
+        if not supabase:
+            self.send_response(503)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+            send_security_headers(self)
+            self.end_headers()
+            self.wfile.write(json.dumps({"success": False, "error": "Stream unavailable"}).encode())
+            return
+
+        # 断线重连时浏览器会带上 Last-Event-ID；首次连接可以用 ?since=<watermark> 指定起点
+        query_params = parse_qs(urlparse(self.path).query)
+        last_event_id = self.headers.get('Last-Event-ID') or query_params.get('since', [None])[0]
+        last_position = event_position(last_event_id) if last_event_id else None
+        if last_position is None:
+            last_event_id = None
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache, no-transform')
+        self.send_header('Connection', 'keep-alive')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        send_security_headers(self)
+        self.end_headers()
+
+        # 先订阅再补发，补发期间产生的新事件会在队列中等待，不会丢失
+        subscriber, replay = broadcaster.subscribe(last_event_id)
+        try:
+            self.write_chunk(f"retry: {SSE_RETRY_MS}\n\n".encode())
+
+            if replay is None:
+                # 缓冲区中已经没有该事件，单独补查；按 has_more 逐页补发，直到追上最新位置
+                # 否则之后的心跳会把 Last-Event-ID 推进到广播器水位线，剩余的变更就丢了
+                has_more = True
+                while has_more:
+                    rows, has_more = query_changes(supabase, SSE_CATCH_UP_LIMIT, last_position)
+                    if not rows:
+                        break
+                    for row in rows:
+                        last_position = self.send_event(row_to_event(row), last_position)
+                replay = []
+
+            for event in replay:
+                last_position = self.send_event(event, last_position)
+
+            deadline = time.monotonic() + SSE_MAX_DURATION
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = subscriber.get(timeout=min(SSE_HEARTBEAT_INTERVAL, remaining))
+                except queue.Empty:
+                    # 心跳注释，客户端会忽略
+                    self.write_chunk(b": ping\n" + self.checkpoint_line(subscriber) + b"\n")
+                    continue
+                if event is None:
+                    break
+                last_position = self.send_event(event, last_position)
+
+            # 结束前同步一次位置，重连时无需补查
+            self.write_chunk(self.checkpoint_line(subscriber) + b"\n")
+
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开
+            pass
+        except Exception as e:
+            self.request_log.error("unexpected_error", error=str(e))
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    def send_event(self, event, last_position):
+        """发送一条事件，跳过客户端已经收到过的位置；返回新的 last_position"""
+        event_id, event_type, data = event
+        position = event_position(event_id)
+        if last_position is not None and position is not None and position <= last_position:
+            return last_position
+        self.write_chunk(format_event(event_id, event_type, data))
+        return position or last_position
+
+    def checkpoint_line(self, subscriber):
+        """
+        只含 id 字段的行：浏览器会更新 Last-Event-ID，但不会触发事件
+        没有新事件时也能推进客户端位置，重连后直接从广播器缓冲区继续
+        """
+        watermark = broadcaster.checkpoint(subscriber)
+        return f"id: {watermark}\n".encode() if watermark else b""
+
+    def write_chunk(self, data):
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def do_OPTIONS(self):
+        # 处理 CORS 预检请求
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        send_security_headers(self)
+        self.end_headers()
@@ -3,27 +3,18 @@ import json
 import os
 import logging
 
+from api._lib.reqlog import RequestLogMixin
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Supabase 配置
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+# Telegram Webhook 配置
 TELEGRAM_WEBHOOK_SECRET = os.environ.get("TELEGRAM_WEBHOOK_SECRET", "")
 
 # CORS 配置（默认允许所有来源，生产环境应设置为具体域名）
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 
-# 初始化 Supabase 客户端
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    except Exception as e:
-        logger.error(f"Failed to initialize Supabase: {e}")
-
 
 def send_security_headers(handler_instance):
     """添加安全响应头"""
@@ -34,7 +25,9 @@ def send_security_headers(handler_instance):
     handler_instance.send_header('Permissions-Policy', 'camera=(), microphone=(), geolocation=(), interest-cohort=()')
 
 
-class handler(BaseHTTPRequestHandler):
+class handler(RequestLogMixin, BaseHTTPRequestHandler):
+    route = "/api/webhook"
+
     def do_POST(self):
         try:
             # 验证 Telegram Webhook Secret（必须配置）
@@ -85,17 +78,10 @@ class handler(BaseHTTPRequestHandler):
             # 注意：这里简化了处理逻辑，实际应该包含完整的 Bot 处理逻辑
             # 由于 Vercel Serverless 的限制，复杂的 Bot 逻辑可能需要单独部署
 
-            # 提取消息内容
-            message = update_data.get('message', {})
-            text = message.get('text', '')
-
-            logger.info(f"Received Telegram update: {update_data.get('update_id')}")
+            self.request_log.set(update_id=update_data.get('update_id'))
 
-            # 如果有 Supabase 连接，可以保存消息
-            if supabase and text:
-                # 这里可以添加保存到数据库的逻辑
-                # 例如：supabase.table('gold_signals').insert({...}).execute()
-                pass
+            # 消息本身不在这里入库：没有审核、白名单和 update_id 去重，发帖由 Bot 服务写入 gold_signals
+            # 首页快照也不在这里重建：gold_signals 的触发器会使旧快照失效，下一个首页请求实时查询并写回
 
             # 返回成功响应
             self.send_response(200)
@@ -106,7 +92,7 @@ class handler(BaseHTTPRequestHandler):
 
         except Exception as e:
             # 记录错误但不暴露详细信息
-            logger.error(f"Unexpected error in webhook: {e}")
+            self.request_log.error("unexpected_error", error=str(e))
 
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
@@ -0,0 +1,220 @@
+-- ============================================
+-- user_sessions 按月分区（可选）
+-- ============================================
+-- 说明：会话很多时可以把 user_sessions 改为按 created_at 每月一个分区：
+-- 1. 超过保留期的整月会话用 DETACH + DROP 一次移除，不产生逐行 DELETE 的 WAL 和表膨胀
+-- 2. 每个分区上的活跃会话部分索引都很小，登录和心跳的查询耗时不随历史会话增长
+-- 3. scripts/sweep_sessions.py 检测到 ensure_user_sessions_partitions 函数后自动创建后续月份的分区、移除过期分区
+--
+-- 关于 DETACH 的锁：DETACH PARTITION 不能放在函数里以 CONCURRENTLY 方式执行，由 sweep_sessions.py 单独执行。
+-- 存在默认分区（user_sessions_default）时 PostgreSQL 不允许 CONCURRENTLY，普通 DETACH 会对 user_sessions
+-- 加 ACCESS EXCLUSIVE 锁：持锁时间很短，但排队等锁期间登录和心跳也会等待（脚本设置了 lock_timeout，
+-- 拿不到锁就跳过，下次再试），请在低峰期运行。确认按时创建了后续月份的分区后，可以删除空的默认分区
+-- （DROP TABLE user_sessions_default;），此后脚本使用 DETACH ... CONCURRENTLY（PostgreSQL 14+），不阻塞读写；
+-- 代价是如果长时间没有运行脚本、当月分区不存在，写入会话会失败。
+--
+-- 前提：已执行 database-user-profiles.sql（包含 user_sessions_archive、expire_sessions、archive_sessions）。
+-- 迁移会把现有会话复制到新表，期间锁定 user_sessions，请在低峰期执行。
+-- 分区表的主键必须包含分区键，主键变为 (id, created_at)；fingerprint_bands 不能再用外键引用会话，
+-- 改由 purge_fingerprint_bands 按时间清理。
+-- ============================================
+
+BEGIN;
+
+-- 1. fingerprint_bands 不再引用会话（分区表上没有单独的 id 唯一约束）
+ALTER TABLE fingerprint_bands DROP CONSTRAINT IF EXISTS fingerprint_bands_session_id_fkey;
+
+-- 2. 旧表改名，创建分区表
+ALTER TABLE user_sessions RENAME TO user_sessions_legacy;
+
+CREATE TABLE user_sessions (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    fingerprint_raw JSONB NOT NULL,
+    fingerprint_hash VARCHAR(64) NOT NULL,
+    fingerprint_vector INTEGER[],
+    ip_address INET,
+    user_agent TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen_at TIMESTAMPTZ DEFAULT NOW(),
+    is_active BOOLEAN DEFAULT true,
+    kicked_reason TEXT,
+    similarity_score NUMERIC(5,2),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- 3. 按月创建分区（分区名 user_sessions_YYYYMM），返回新建的分区数
+--    默认分区只用于兜底：按时创建后续月份的分区，默认分区应保持为空
+CREATE OR REPLACE FUNCTION ensure_user_sessions_partitions(
+    p_months_ahead INTEGER DEFAULT 2,
+    p_from TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::DATE;
+    last_month DATE := (date_trunc('month', NOW()) + make_interval(months => p_months_ahead))::DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := 'user_sessions_' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF user_sessions FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, (month_start + INTERVAL '1 month')::DATE);
+            EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', partition_name);
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS user_sessions_default PARTITION OF user_sessions DEFAULT;
+ALTER TABLE user_sessions_default ENABLE ROW LEVEL SECURITY;
+
+SELECT ensure_user_sessions_partitions(
+    2,
+    COALESCE((SELECT MIN(COALESCE(created_at, last_seen_at)) FROM user_sessions_legacy), NOW())
+);
+
+-- 4. 复制现有会话，删除旧表（旧表上的索引和策略一起删除）
+INSERT INTO user_sessions (id, user_id, fingerprint_raw, fingerprint_hash, fingerprint_vector, ip_address, user_agent,
+                           created_at, last_seen_at, is_active, kicked_reason, similarity_score)
+SELECT id, user_id, fingerprint_raw, fingerprint_hash, fingerprint_vector, ip_address, user_agent,
+       COALESCE(created_at, last_seen_at, NOW()), last_seen_at, is_active, kicked_reason, similarity_score
+FROM user_sessions_legacy;
+
+DROP TABLE user_sessions_legacy;
+
+-- 5. 索引（在每个分区上自动创建）
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_fingerprint_hash ON user_sessions(fingerprint_hash);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_created ON user_sessions(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_live ON user_sessions(user_id, last_seen_at DESC) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_user_sessions_live_seen ON user_sessions(last_seen_at) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_user_sessions_inactive_seen ON user_sessions(last_seen_at) WHERE NOT is_active;
+
+-- 6. RLS 与策略（与 database-user-profiles.sql 中一致）
+ALTER TABLE user_sessions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow users to view their own sessions"
+ON user_sessions
+FOR SELECT
+USING (auth.uid() = user_id);
+
+CREATE POLICY "Allow all operations with service role on user_sessions"
+ON user_sessions
+FOR ALL
+USING (true)
+WITH CHECK (true);
+
+-- 7. 移除整月都超过保留期的分区（已执行过旧版本的本文件时，单独执行第 7、9 步即可）
+--    a. expired_user_sessions_partitions 列出整月都超过保留期的分区；分区中仍有会话在使用
+--       （活跃或最后心跳晚于保留期）时 in_use 为 true，跳过（由 archive_sessions 逐行处理）。
+--       上次运行在分离之后中断时，已分离但未删除的月表（attached 为 false）和
+--       CONCURRENTLY 未完成的分区（detach_pending 为 true）也会列出，由脚本继续处理
+--    b. sweep_sessions.py 在事务外执行 ALTER TABLE user_sessions DETACH PARTITION ...（见文件开头关于锁的说明）
+--    c. drop_detached_sessions_partition 把已分离的表写入归档表（p_purge 为 false 时）后删除，返回归档的行数
+DROP FUNCTION IF EXISTS drop_user_sessions_partitions(INTERVAL, BOOLEAN);
+
+CREATE OR REPLACE FUNCTION expired_user_sessions_partitions(
+    p_retention INTERVAL DEFAULT INTERVAL '90 days'
+)
+RETURNS TABLE (partition_name TEXT, attached BOOLEAN, detach_pending BOOLEAN, in_use BOOLEAN)
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    child RECORD;
+    cutoff TIMESTAMPTZ := NOW() - p_retention;
+BEGIN
+    FOR child IN
+        SELECT c.relname::TEXT AS name, i.inhrelid IS NOT NULL AS attached, COALESCE(i.inhdetachpending, false) AS pending
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r'
+          AND c.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = 'user_sessions'::regclass)
+          AND (i.inhparent IS NULL OR i.inhparent = 'user_sessions'::regclass)
+          AND c.relname ~ '^user_sessions_[0-9]{6}$'
+          AND to_date(substring(c.relname FROM '[0-9]{6}$'), 'YYYYMM') + INTERVAL '1 month' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        partition_name := child.name;
+        attached := child.attached;
+        detach_pending := child.pending;
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE is_active OR last_seen_at >= %L)', child.name, cutoff)
+        INTO in_use;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION drop_detached_sessions_partition(
+    p_partition TEXT,
+    p_purge BOOLEAN DEFAULT false
+)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    moved INTEGER := 0;
+BEGIN
+    -- 只处理已经分离的月分区，避免误删其他表
+    IF p_partition !~ '^user_sessions_[0-9]{6}$' OR to_regclass(p_partition) IS NULL THEN
+        RAISE EXCEPTION 'not a sessions partition: %', p_partition;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(p_partition)) THEN
+        RAISE EXCEPTION 'partition % is still attached to user_sessions', p_partition;
+    END IF;
+
+    IF NOT p_purge THEN
+        EXECUTE format(
+            'INSERT INTO user_sessions_archive (id, user_id, fingerprint_hash, fingerprint_vector, ip_address, user_agent,
+                                                created_at, last_seen_at, kicked_reason, similarity_score)
+             SELECT id, user_id, fingerprint_hash, fingerprint_vector, ip_address, user_agent,
+                    created_at, last_seen_at, kicked_reason, similarity_score
+             FROM %I
+             ON CONFLICT (id) DO NOTHING', p_partition);
+        GET DIAGNOSTICS moved = ROW_COUNT;
+    END IF;
+
+    EXECUTE format('DROP TABLE %I', p_partition);
+    RETURN moved;
+END;
+$$;
+
+-- 8. 按时间清理 fingerprint_bands（分区表上没有级联删除），返回本批删除的行数
+CREATE OR REPLACE FUNCTION purge_fingerprint_bands(
+    p_retention INTERVAL DEFAULT INTERVAL '90 days',
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    WITH old AS (
+        SELECT fb.session_id, fb.band_no
+        FROM fingerprint_bands fb
+        WHERE fb.created_at < NOW() - p_retention
+        LIMIT p_limit
+    ), removed AS (
+        DELETE FROM fingerprint_bands fb
+        USING old
+        WHERE fb.session_id = old.session_id AND fb.band_no = old.band_no
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM removed;
+$$;
+
+-- 9. 只允许服务端（service_role）调用
+REVOKE EXECUTE ON FUNCTION ensure_user_sessions_partitions(INTEGER, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_user_sessions_partitions(INTEGER, TIMESTAMPTZ) TO service_role;
+REVOKE EXECUTE ON FUNCTION expired_user_sessions_partitions(INTERVAL) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION expired_user_sessions_partitions(INTERVAL) TO service_role;
+REVOKE EXECUTE ON FUNCTION drop_detached_sessions_partition(TEXT, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION drop_detached_sessions_partition(TEXT, BOOLEAN) TO service_role;
+REVOKE EXECUTE ON FUNCTION purge_fingerprint_bands(INTERVAL, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION purge_fingerprint_bands(INTERVAL, INTEGER) TO service_role;
+
+COMMIT;
+
+-- ============================================
+-- 执行以下查询验证分区是否创建成功
+-- SELECT inhrelid::regclass FROM pg_inherits WHERE inhparent = 'user_sessions'::regclass ORDER BY 1;
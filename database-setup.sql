@@ -46,6 +46,14 @@ CREATE INDEX IF NOT EXISTS idx_gold_signals_status ON gold_signals(status);
 CREATE INDEX IF NOT EXISTS idx_gold_signals_author_id ON gold_signals(author_id);
 CREATE INDEX IF NOT EXISTS idx_gold_signals_deleted_at ON gold_signals(deleted_at) WHERE deleted_at IS NULL;
 
+-- 首页列表 keyset 分页索引：与 /api/posts 的过滤条件及 (created_at DESC, id DESC) 排序一致
+-- 每一页都是一次索引范围扫描，翻页深度不影响查询代价
+CREATE INDEX IF NOT EXISTS idx_gold_signals_feed ON gold_signals(created_at DESC, id DESC)
+WHERE is_filtered = FALSE AND deleted_at IS NULL AND status = 'published';
+
+-- 增量同步索引：/api/posts?since= 按 (updated_at, id) 读取水位线之后的变更（包括删除、过滤、归档）
+CREATE INDEX IF NOT EXISTS idx_gold_signals_updated_at ON gold_signals(updated_at, id);
+
 -- 3. 创建自动更新 updated_at 的触发器
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -89,6 +97,195 @@ FOR ALL
 USING (true)
 WITH CHECK (true);
 
+-- 8. 全文搜索（/api/posts/search）
+-- 中文没有空格分词，默认的 text search 解析器无法切分；这里自行切词：
+--   - 英文单词、数字（含小数，如价格 2050.5）整体作为一个词
+--   - 连续的中日韩字符切成相邻二元组（bigram），文档侧额外保留单字，支持单字查询
+-- 切出的词直接用 array_to_tsvector 生成 tsvector，不经过解析器，结果与数据库 locale 无关
+CREATE OR REPLACE FUNCTION cjk_tokens(input TEXT, with_unigrams BOOLEAN DEFAULT TRUE)
+RETURNS TEXT[]
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    normalized TEXT := lower(coalesce(input, ''));
+    tokens TEXT[];
+    run TEXT;
+    i INT;
+BEGIN
+    SELECT coalesce(array_agg(m[1]), ARRAY[]::TEXT[]) INTO tokens
+    FROM regexp_matches(normalized, '([a-z0-9]+(?:\.[0-9]+)?)', 'g') AS m;
+
+    -- 假名、CJK 扩展 A、CJK 统一汉字、韩文音节、CJK 兼容汉字
+    FOR run IN
+        SELECT m[1]
+        FROM regexp_matches(normalized, '([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)', 'g') AS m
+    LOOP
+        IF char_length(run) = 1 THEN
+            tokens := tokens || run;
+            CONTINUE;
+        END IF;
+        FOR i IN 1 .. char_length(run) - 1 LOOP
+            tokens := tokens || substr(run, i, 2);
+        END LOOP;
+        IF with_unigrams THEN
+            FOR i IN 1 .. char_length(run) LOOP
+                tokens := tokens || substr(run, i, 1);
+            END LOOP;
+        END IF;
+    END LOOP;
+
+    RETURN tokens;
+END;
+$$;
+
+-- 查询侧：同样切词，所有词都必须命中（AND）；没有可用的词时返回 NULL（不匹配任何行）
+CREATE OR REPLACE FUNCTION cjk_search_query(input TEXT)
+RETURNS tsquery
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN cardinality(tokens) = 0 THEN NULL
+        ELSE array_to_string(ARRAY(SELECT DISTINCT quote_literal(token) FROM unnest(tokens) AS token), ' & ')::tsquery
+    END
+    FROM (SELECT cjk_tokens(input, FALSE) AS tokens) AS q;
+$$;
+
+-- 生成列：content 变化时自动重建，无需触发器
+ALTER TABLE gold_signals
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (array_to_tsvector(cjk_tokens(content, TRUE))) STORED;
+
+-- 与首页列表相同的可见性条件，只索引公开的帖子
+CREATE INDEX IF NOT EXISTS idx_gold_signals_search ON gold_signals USING GIN (search_vector)
+WHERE is_filtered = FALSE AND deleted_at IS NULL AND status = 'published';
+
+-- 搜索 RPC：GIN 索引筛出候选行，按相关度（保留 6 位小数，便于游标精确比较）和 id 倒序排列
+-- 游标为上一页最后一条的 (rank, id)
+CREATE OR REPLACE FUNCTION search_gold_signals(
+    search_query TEXT,
+    result_limit INT DEFAULT 20,
+    after_rank NUMERIC DEFAULT NULL,
+    after_id INT DEFAULT NULL
+)
+RETURNS TABLE (
+    id INT,
+    content TEXT,
+    image_path VARCHAR,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP,
+    rank NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    SELECT matched.*
+    FROM (
+        SELECT g.id, g.content, g.image_path, g.created_at, g.updated_at,
+               round(ts_rank(g.search_vector, q.query)::NUMERIC, 6) AS rank
+        FROM gold_signals AS g,
+             (SELECT cjk_search_query(search_query) AS query) AS q
+        WHERE g.search_vector @@ q.query
+          AND g.is_filtered = FALSE
+          AND g.deleted_at IS NULL
+          AND g.status = 'published'
+    ) AS matched
+    WHERE after_rank IS NULL OR (matched.rank, matched.id) < (after_rank, after_id)
+    ORDER BY matched.rank DESC, matched.id DESC
+    LIMIT result_limit;
+$$;
+
+-- 9. 首页快照（/api/posts 首页直接读取，不再每次查询 gold_signals）
+-- body_gzip 为 gzip 压缩后 base64 编码的 JSON 响应体；generation 为生成快照时的数据版本
+CREATE TABLE IF NOT EXISTS feed_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    body_gzip TEXT NOT NULL,
+    etag VARCHAR(100) NOT NULL,
+    last_modified TIMESTAMPTZ,
+    generation BIGINT NOT NULL,
+    built_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 数据版本：只有一行，gold_signals 每次影响首页的写入都会递增
+CREATE TABLE IF NOT EXISTS feed_snapshot_state (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    generation BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO feed_snapshot_state (id, generation) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- 只允许 service_role 访问（未创建任何策略）
+ALTER TABLE feed_snapshots ENABLE ROW LEVEL SECURITY;
+ALTER TABLE feed_snapshot_state ENABLE ROW LEVEL SECURITY;
+
+-- 新增、编辑、软删除帖子时递增版本号，旧快照随即失效
+-- SECURITY DEFINER：作者通过 RLS 修改自己的帖子时也能更新版本号
+CREATE OR REPLACE FUNCTION invalidate_feed_snapshots()
+RETURNS TRIGGER
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+    UPDATE feed_snapshot_state SET generation = generation + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$;
+
+-- 浏览量、点赞数等统计字段不影响首页内容，不触发
+DROP TRIGGER IF EXISTS gold_signals_invalidate_feed_snapshots ON gold_signals;
+CREATE TRIGGER gold_signals_invalidate_feed_snapshots
+    AFTER INSERT OR DELETE OR UPDATE OF content, image_path, status, is_filtered, deleted_at, created_at
+    ON gold_signals
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION invalidate_feed_snapshots();
+
+-- 读取快照：一次主键查询；版本不一致时 body_gzip 为 NULL，同时返回当前版本号供写回使用
+CREATE OR REPLACE FUNCTION get_feed_snapshot(snapshot_name TEXT)
+RETURNS TABLE (body_gzip TEXT, etag VARCHAR, last_modified TIMESTAMPTZ, generation BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT s.body_gzip, s.etag, s.last_modified, st.generation
+    FROM feed_snapshot_state AS st
+    LEFT JOIN feed_snapshots AS s
+        ON s.name = snapshot_name AND s.generation = st.generation
+    WHERE st.id = 1;
+$$;
+
+-- 写回快照：锁住版本行再比较，生成期间如有新的写入（版本已变化）则拒绝，返回 FALSE
+CREATE OR REPLACE FUNCTION store_feed_snapshot(
+    snapshot_name TEXT,
+    snapshot_body_gzip TEXT,
+    snapshot_etag TEXT,
+    snapshot_last_modified TIMESTAMPTZ,
+    built_generation BIGINT
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql AS $$
+DECLARE
+    current_generation BIGINT;
+BEGIN
+    SELECT generation INTO current_generation FROM feed_snapshot_state WHERE id = 1 FOR UPDATE;
+    IF current_generation IS DISTINCT FROM built_generation THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO feed_snapshots (name, body_gzip, etag, last_modified, generation, built_at)
+    VALUES (snapshot_name, snapshot_body_gzip, snapshot_etag, snapshot_last_modified, built_generation, NOW())
+    ON CONFLICT (name) DO UPDATE SET
+        body_gzip = EXCLUDED.body_gzip,
+        etag = EXCLUDED.etag,
+        last_modified = EXCLUDED.last_modified,
+        generation = EXCLUDED.generation,
+        built_at = EXCLUDED.built_at;
+    RETURN TRUE;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION store_feed_snapshot(TEXT, TEXT, TEXT, TIMESTAMPTZ, BIGINT) FROM PUBLIC, anon, authenticated;
+
+-- 10. 摘要视图（/api/posts?view=summary）使用的生成列：写入时计算一次，读取时不再传输全文
+-- excerpt 长度与 api/_lib/feed.py 中的 EXCERPT_LENGTH 一致
+ALTER TABLE gold_signals
+    ADD COLUMN IF NOT EXISTS excerpt TEXT
+    GENERATED ALWAYS AS (left(btrim(regexp_replace(content, '\s+', ' ', 'g')), 120)) STORED;
+ALTER TABLE gold_signals
+    ADD COLUMN IF NOT EXISTS content_length INTEGER
+    GENERATED ALWAYS AS (char_length(content)) STORED;
+ALTER TABLE gold_signals
+    ADD COLUMN IF NOT EXISTS has_image BOOLEAN
+    GENERATED ALWAYS AS (coalesce(btrim(image_path), '') <> '') STORED;
+
 -- ============================================
 -- 插入测试数据（可选）
 -- ============================================
@@ -208,3 +208,496 @@ WITH CHECK (true);
 -- 执行以下查询验证新表是否创建成功
 -- SELECT * FROM user_sessions LIMIT 10;
 -- SELECT * FROM account_anomaly_logs ORDER BY detected_at DESC LIMIT 10;
+
+-- ============================================
+-- 登录事务函数（login_with_fingerprint）
+-- ============================================
+-- 说明：登录时的会话轮换、风险评分和账号状态变更在一个事务中完成，
+--       /api/auth/login 在 Supabase Auth 登录成功后只需一次 rpc() 调用。
+--       先锁定用户资料行，同一用户同时登录的请求依次执行，不会同时保留两个活跃会话。
+-- ============================================
+
+-- 24. 设备指纹相似度（加权，0-1）：两边都有的字段中，取值相同的字段权重占比
+CREATE OR REPLACE FUNCTION fingerprint_similarity(fp1 JSONB, fp2 JSONB)
+RETURNS NUMERIC
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT COALESCE(
+        sum(w.weight) FILTER (WHERE fp1->w.key = fp2->w.key)
+            / NULLIF(sum(w.weight) FILTER (WHERE fp1 ? w.key AND fp2 ? w.key), 0),
+        0
+    )
+    FROM (VALUES
+        ('canvas_hash', 0.3),
+        ('audio_hash', 0.2),
+        ('screen_width', 0.1),
+        ('screen_height', 0.1),
+        ('device_pixel_ratio', 0.05),
+        ('platform', 0.1),
+        ('browser_family', 0.05),
+        ('browser_major', 0.05),
+        ('timezone_offset', 0.05)
+    ) AS w(key, weight)
+$$;
+
+-- 25. 登录：轮换会话、记录异常、更新风险分数与账号状态
+-- result：ok / not_found（用户资料不存在）/ banned（账号已封禁，不做任何修改）
+-- status_version 为登录完成后的全局账号状态版本号（写入会话令牌）
+-- p_similarity_score：接口已与该用户的历史设备比较过时传入（见 recent_fingerprints），
+--                     为 NULL 时与最近的活跃会话比较
+-- p_fingerprint_bands：设备指纹的 LSH band（见 fingerprint_bands），写入索引并查找近期用过同一设备的其他账号，
+--                      shared_accounts 为找到的账号数
+DROP FUNCTION IF EXISTS login_with_fingerprint(UUID, JSONB, TEXT, TEXT, TEXT, INTERVAL);
+DROP FUNCTION IF EXISTS login_with_fingerprint(UUID, JSONB, TEXT, TEXT, TEXT, INTERVAL, INTEGER[], NUMERIC);
+DROP FUNCTION IF EXISTS login_with_fingerprint(UUID, JSONB, TEXT, TEXT, TEXT, INTERVAL, INTEGER[], NUMERIC, BIGINT[]);
+CREATE OR REPLACE FUNCTION login_with_fingerprint(
+    p_user_id UUID,
+    p_fingerprint_raw JSONB,
+    p_fingerprint_hash TEXT,
+    p_ip_address TEXT DEFAULT NULL,
+    p_user_agent TEXT DEFAULT '',
+    p_active_window INTERVAL DEFAULT INTERVAL '15 minutes',
+    p_fingerprint_vector INTEGER[] DEFAULT NULL,
+    p_similarity_score NUMERIC DEFAULT NULL,
+    p_fingerprint_bands BIGINT[] DEFAULT NULL
+)
+RETURNS TABLE (
+    result TEXT,
+    username VARCHAR,
+    account_status VARCHAR,
+    risk_score INTEGER,
+    similarity_score NUMERIC,
+    session_id UUID,
+    session_created_at TIMESTAMPTZ,
+    status_version BIGINT,
+    shared_accounts INTEGER
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    profile user_profiles%ROWTYPE;
+    old_session user_sessions%ROWTYPE;
+    similarity NUMERIC := 1.0;
+    risk_change INTEGER := 0;
+    new_risk_score INTEGER;
+    new_status VARCHAR;
+    new_session user_sessions%ROWTYPE;
+    shared JSONB;
+    shared_count INTEGER := 0;
+BEGIN
+    -- 锁定用户资料行：同一用户的并发登录在这里排队
+    SELECT * INTO profile FROM user_profiles p WHERE p.user_id = p_user_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'not_found'::TEXT, NULL::VARCHAR, NULL::VARCHAR, NULL::INTEGER, NULL::NUMERIC, NULL::UUID, NULL::TIMESTAMPTZ, NULL::BIGINT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    IF profile.account_status = 'banned' THEN
+        RETURN QUERY SELECT 'banned'::TEXT, profile.username, profile.account_status, profile.risk_score, NULL::NUMERIC, NULL::UUID, NULL::TIMESTAMPTZ, NULL::BIGINT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    -- 最近活跃的会话（活跃窗口内）
+    SELECT * INTO old_session
+    FROM user_sessions s
+    WHERE s.user_id = p_user_id AND s.is_active AND s.last_seen_at >= NOW() - p_active_window
+    ORDER BY s.last_seen_at DESC
+    LIMIT 1;
+
+    IF FOUND THEN
+        similarity := COALESCE(p_similarity_score, fingerprint_similarity(old_session.fingerprint_raw, p_fingerprint_raw));
+
+        -- 指纹不相似，可能是账号共享
+        IF similarity < 0.5 THEN
+            risk_change := 15;
+            INSERT INTO account_anomaly_logs (user_id, event_type, details, risk_score_change)
+            VALUES (
+                p_user_id,
+                'concurrent_login_different_device',
+                jsonb_build_object(
+                    'old_fingerprint_hash', old_session.fingerprint_hash,
+                    'new_fingerprint_hash', p_fingerprint_hash,
+                    'similarity_score', similarity
+                ),
+                risk_change
+            );
+        END IF;
+
+        -- 踢掉活跃窗口内的旧会话
+        UPDATE user_sessions s
+        SET is_active = false, kicked_reason = 'new_login'
+        WHERE s.user_id = p_user_id AND s.is_active AND s.last_seen_at >= NOW() - p_active_window;
+    END IF;
+
+    INSERT INTO user_sessions (user_id, fingerprint_raw, fingerprint_hash, fingerprint_vector, ip_address, user_agent, is_active, similarity_score)
+    VALUES (p_user_id, p_fingerprint_raw, p_fingerprint_hash, p_fingerprint_vector, p_ip_address::INET, p_user_agent, true, similarity)
+    RETURNING * INTO new_session;
+
+    -- 跨账号设备共享：先查找再写入索引，只读取与新设备 band 相同的行
+    IF p_fingerprint_bands IS NOT NULL THEN
+        SELECT COUNT(*), jsonb_agg(jsonb_build_object('user_id', d.user_id, 'matched_bands', d.matched_bands,
+                                                      'last_seen_at', d.last_seen_at) ORDER BY d.matched_bands DESC)
+        INTO shared_count, shared
+        FROM similar_devices(p_fingerprint_bands, p_user_id) d;
+
+        IF shared_count > 0 THEN
+            INSERT INTO account_anomaly_logs (user_id, event_type, details, risk_score_change)
+            VALUES (
+                p_user_id,
+                'device_shared_across_accounts',
+                jsonb_build_object(
+                    'fingerprint_hash', p_fingerprint_hash,
+                    'session_id', new_session.id,
+                    'accounts', shared
+                ),
+                0
+            );
+        END IF;
+
+        INSERT INTO fingerprint_bands (band_no, band_hash, session_id, user_id, created_at)
+        SELECT (b.ord - 1)::SMALLINT, b.band_hash, new_session.id, p_user_id, new_session.created_at
+        FROM unnest(p_fingerprint_bands) WITH ORDINALITY AS b(band_hash, ord);
+    END IF;
+
+    -- 根据风险分数调整账号状态
+    new_risk_score := profile.risk_score + risk_change;
+    new_status := CASE
+        WHEN new_risk_score >= 70 THEN 'banned'
+        WHEN new_risk_score >= 40 THEN 'limited'
+        ELSE 'active'
+    END;
+
+    UPDATE user_profiles p
+    SET last_login_at = NOW(),
+        risk_score = new_risk_score,
+        account_status = new_status,
+        status_updated_at = CASE WHEN new_status <> profile.account_status THEN NOW() ELSE p.status_updated_at END
+    WHERE p.user_id = p_user_id;
+
+    RETURN QUERY SELECT 'ok'::TEXT, profile.username, new_status, new_risk_score, similarity, new_session.id, new_session.created_at,
+        (SELECT st.version FROM account_status_state st WHERE st.id), shared_count;
+END;
+$$;
+
+-- 26. 只允许服务端（service_role）调用：参数中的 user_id 不经过身份校验
+REVOKE EXECUTE ON FUNCTION login_with_fingerprint(UUID, JSONB, TEXT, TEXT, TEXT, INTERVAL, INTEGER[], NUMERIC, BIGINT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION login_with_fingerprint(UUID, JSONB, TEXT, TEXT, TEXT, INTERVAL, INTEGER[], NUMERIC, BIGINT[]) TO service_role;
+
+-- ============================================
+-- 账号状态版本号（Account Status Version）
+-- ============================================
+-- 说明：心跳接口在实例内缓存会话的账号状态，命中时不访问数据库。
+--       account_status 每次变化（登录时风险分数变化、管理员封禁、后台任务等）都会由触发器
+--       递增全局版本号并写入该用户的 status_version；实例定期读取全局版本号（一次主键读取），
+--       版本号变化后缓存中旧版本的条目全部失效，封禁在一个检查间隔内生效。
+-- ============================================
+
+-- 27. 全局版本号（单行表）
+CREATE TABLE IF NOT EXISTS account_status_state (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO account_status_state (id, version) VALUES (true, 0) ON CONFLICT (id) DO NOTHING;
+
+ALTER TABLE account_status_state ENABLE ROW LEVEL SECURITY;
+
+-- 28. 用户资料上记录最近一次状态变化时的版本号
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS status_version BIGINT NOT NULL DEFAULT 0;
+
+-- 29. 账号状态变化时递增版本号
+CREATE OR REPLACE FUNCTION bump_account_status_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE account_status_state SET version = version + 1 WHERE id
+    RETURNING version INTO NEW.status_version;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_account_status_changed ON user_profiles;
+CREATE TRIGGER on_account_status_changed
+BEFORE UPDATE OF account_status ON user_profiles
+FOR EACH ROW
+WHEN (OLD.account_status IS DISTINCT FROM NEW.account_status)
+EXECUTE FUNCTION bump_account_status_version();
+
+-- 30. 读取全局版本号
+CREATE OR REPLACE FUNCTION account_status_version()
+RETURNS BIGINT
+LANGUAGE sql STABLE AS $$
+    SELECT version FROM account_status_state WHERE id;
+$$;
+
+REVOKE EXECUTE ON FUNCTION account_status_version() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION account_status_version() TO service_role;
+
+-- ============================================
+-- 心跳函数（heartbeat / touch_sessions）
+-- ============================================
+-- 说明：/api/auth/heartbeat 每个登录中的标签页定时调用，是请求最频繁的接口。
+--       heartbeat 一次调用完成：读取会话与账号状态、账号被封禁时让会话失效，
+--       取代原来的 查询会话 → 更新 last_seen_at → 查询账号状态（→ 封禁时再更新会话）多次往返。
+--       last_seen_at 不在每次心跳时写入：接口只在它明显过期时记下本次心跳时间，
+--       再由 touch_sessions 按固定间隔批量写回（一条多行 UPDATE），减少 user_sessions 的行更新和 WAL。
+-- ============================================
+
+-- 31. 心跳：会话不存在时不返回任何行；account_status 为 NULL 表示用户资料不存在
+--     返回的 last_seen_at 供接口判断是否需要写回，status_version 为读取时的全局版本号（缓存账号状态时使用），
+--     is_active 为本次心跳之后会话是否仍然有效（轮换会话令牌时检查）
+DROP FUNCTION IF EXISTS heartbeat(UUID);
+CREATE OR REPLACE FUNCTION heartbeat(p_session_id UUID)
+RETURNS TABLE (user_id UUID, account_status VARCHAR, last_seen_at TIMESTAMPTZ, status_version BIGINT, is_active BOOLEAN)
+LANGUAGE sql AS $$
+    WITH profile AS (
+        SELECT p.user_id, p.account_status
+        FROM user_sessions s
+        JOIN user_profiles p ON p.user_id = s.user_id
+        WHERE s.id = p_session_id
+    ), kicked AS (
+        -- 账号被封禁时强制下线
+        UPDATE user_sessions s
+        SET is_active = false
+        WHERE s.id = p_session_id AND s.is_active
+          AND EXISTS (SELECT 1 FROM profile WHERE profile.account_status = 'banned')
+    )
+    SELECT s.user_id, (SELECT profile.account_status FROM profile), s.last_seen_at,
+           (SELECT version FROM account_status_state WHERE id),
+           s.is_active AND NOT EXISTS (SELECT 1 FROM profile WHERE profile.account_status = 'banned')
+    FROM user_sessions s
+    WHERE s.id = p_session_id;
+$$;
+
+-- 32. 批量写回心跳时间：只更新比传入时间旧的行，返回实际更新的行数
+--     按 id 顺序加锁并跳过已被锁定的行（其他实例正在写回同一会话），多个实例同时写回不会死锁
+CREATE OR REPLACE FUNCTION touch_sessions(p_session_ids UUID[], p_seen_at TIMESTAMPTZ[])
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    WITH pending AS (
+        SELECT * FROM unnest(p_session_ids, p_seen_at) AS v(id, seen_at)
+    ), locked AS (
+        SELECT s.id, pending.seen_at
+        FROM user_sessions s
+        JOIN pending ON pending.id = s.id
+        WHERE s.last_seen_at < pending.seen_at
+        ORDER BY s.id
+        FOR UPDATE OF s SKIP LOCKED
+    ), touched AS (
+        UPDATE user_sessions s
+        SET last_seen_at = locked.seen_at
+        FROM locked
+        WHERE s.id = locked.id
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM touched;
+$$;
+
+-- 33. 只允许服务端（service_role）调用
+REVOKE EXECUTE ON FUNCTION heartbeat(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION heartbeat(UUID) TO service_role;
+REVOKE EXECUTE ON FUNCTION touch_sessions(UUID[], TIMESTAMPTZ[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION touch_sessions(UUID[], TIMESTAMPTZ[]) TO service_role;
+
+-- ============================================
+-- 设备指纹向量（Fingerprint Vectors）
+-- ============================================
+-- 说明：登录时把指纹编码为定长整数向量（每个加权字段一个哈希值，缺失为 0，见 api/_lib/fingerprint.py），
+--       随会话保存；新登录与该用户近期所有会话的向量批量比较，用过的旧设备不再被当成新设备。
+-- ============================================
+
+-- 34. 会话的指纹向量（迁移前创建的会话为 NULL，接口从 fingerprint_raw 现算）
+ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS fingerprint_vector INTEGER[];
+
+-- 35. 按用户取近期会话
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_created ON user_sessions(user_id, created_at DESC);
+
+-- 36. 用户近期会话的指纹（按 Supabase Auth 登录返回的 user_id 查询：Auth 的邮箱不区分大小写，
+--     按输入的用户名查询时大小写不同的登录会取不到历史）
+--     已保存向量的会话不返回 fingerprint_raw，减少传输量
+DROP FUNCTION IF EXISTS recent_fingerprints(TEXT, INTERVAL, INTEGER);
+CREATE OR REPLACE FUNCTION recent_fingerprints(
+    p_user_id UUID,
+    p_since INTERVAL DEFAULT INTERVAL '90 days',
+    p_limit INTEGER DEFAULT 100
+)
+RETURNS TABLE (fingerprint_hash VARCHAR, fingerprint_vector INTEGER[], fingerprint_raw JSONB)
+LANGUAGE sql STABLE AS $$
+    SELECT s.fingerprint_hash, s.fingerprint_vector,
+           CASE WHEN s.fingerprint_vector IS NULL THEN s.fingerprint_raw END
+    FROM user_sessions s
+    WHERE s.user_id = p_user_id AND s.created_at >= NOW() - p_since
+    ORDER BY s.created_at DESC
+    LIMIT p_limit;
+$$;
+
+REVOKE EXECUTE ON FUNCTION recent_fingerprints(UUID, INTERVAL, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION recent_fingerprints(UUID, INTERVAL, INTEGER) TO service_role;
+
+-- ============================================
+-- 跨账号设备索引（Fingerprint Bands）
+-- ============================================
+-- 说明：每个会话的设备指纹按 MinHash/LSH 分为若干个 band（见 api/_lib/fingerprint.py），登录时随会话写入。
+--       相似的设备大概率至少有一个 band 相同：查找"用过同一台设备的其他账号"只读取 band 相同的行，
+--       不扫描 user_sessions，耗时与会话总数无关。结果写入 account_anomaly_logs（device_shared_across_accounts）。
+--       迁移前创建的会话没有 band，用户再次登录后进入索引。
+-- ============================================
+
+-- 37. 创建 fingerprint_bands 表
+CREATE TABLE IF NOT EXISTS fingerprint_bands (
+    band_no SMALLINT NOT NULL,
+    band_hash BIGINT NOT NULL,
+    session_id UUID NOT NULL REFERENCES user_sessions(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (session_id, band_no)
+);
+
+-- 38. 创建索引（按 band 查找，只取最近的行）
+CREATE INDEX IF NOT EXISTS idx_fingerprint_bands_lookup ON fingerprint_bands(band_no, band_hash, created_at DESC);
+
+-- 39. 启用 RLS（不创建策略：只有绕过 RLS 的 service_role 可以访问）
+ALTER TABLE fingerprint_bands ENABLE ROW LEVEL SECURITY;
+
+-- 40. 查找近期用过相似设备的账号
+-- p_bands：新设备的 band（下标从 1 开始，对应 band_no 0..）；p_min_bands：至少相同的 band 数
+-- p_bucket_limit：每个 band 最多读取的行数，常见配置（同型号设备）的 band 很大时也只读取最近的行
+CREATE OR REPLACE FUNCTION similar_devices(
+    p_bands BIGINT[],
+    p_exclude_user UUID DEFAULT NULL,
+    p_since INTERVAL DEFAULT INTERVAL '30 days',
+    p_min_bands INTEGER DEFAULT 2,
+    p_bucket_limit INTEGER DEFAULT 50
+)
+RETURNS TABLE (user_id UUID, matched_bands INTEGER, last_session_id UUID, last_seen_at TIMESTAMPTZ)
+LANGUAGE sql STABLE AS $$
+    SELECT c.user_id,
+           COUNT(DISTINCT b.ord)::INTEGER,
+           (array_agg(c.session_id ORDER BY c.created_at DESC))[1],
+           MAX(c.created_at)
+    FROM unnest(p_bands) WITH ORDINALITY AS b(band_hash, ord)
+    CROSS JOIN LATERAL (
+        SELECT fb.user_id, fb.session_id, fb.created_at
+        FROM fingerprint_bands fb
+        WHERE fb.band_no = b.ord - 1
+          AND fb.band_hash = b.band_hash
+          AND fb.created_at >= NOW() - p_since
+        ORDER BY fb.created_at DESC
+        LIMIT p_bucket_limit
+    ) c
+    WHERE c.user_id IS DISTINCT FROM p_exclude_user
+    GROUP BY c.user_id
+    HAVING COUNT(DISTINCT b.ord) >= p_min_bands
+    ORDER BY 2 DESC, 4 DESC;
+$$;
+
+-- 41. 只允许服务端（service_role）调用
+REVOKE EXECUTE ON FUNCTION similar_devices(BIGINT[], UUID, INTERVAL, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION similar_devices(BIGINT[], UUID, INTERVAL, INTEGER, INTEGER) TO service_role;
+
+-- ============================================
+-- 风险分数重算（scripts/rescore_risk.py）
+-- ============================================
+-- 说明：离线任务按 (user_id, id) 键集分页读取全部异常日志，包含所需列的索引让每页只做一次索引扫描。
+-- ============================================
+
+-- 42. 按用户顺序读取异常日志
+CREATE INDEX IF NOT EXISTS idx_account_anomaly_logs_user_keyset
+ON account_anomaly_logs(user_id, id) INCLUDE (detected_at, event_type, risk_score_change);
+
+-- ============================================
+-- 会话清理与保留（scripts/sweep_sessions.py）
+-- ============================================
+-- 说明：每次登录都会插入一行会话，停止心跳的会话原来一直保持 is_active = true。
+--       expire_sessions 把长时间没有心跳的会话置为失效，archive_sessions 把超过保留期的失效会话
+--       移到 user_sessions_archive（不保留 fingerprint_raw）或直接删除。两个函数每次只处理一批，
+--       由 scripts/sweep_sessions.py 循环调用（也可以用 pg_cron 定时执行）。
+--       活跃会话改用部分索引：索引大小只与在线会话数有关，登录和心跳的查询耗时不随历史会话增长。
+-- ============================================
+
+-- 43. 只包含活跃会话的索引（取代 idx_user_sessions_active）
+CREATE INDEX IF NOT EXISTS idx_user_sessions_live ON user_sessions(user_id, last_seen_at DESC) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_user_sessions_live_seen ON user_sessions(last_seen_at) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_user_sessions_inactive_seen ON user_sessions(last_seen_at) WHERE NOT is_active;
+DROP INDEX IF EXISTS idx_user_sessions_active;
+
+-- 44. 创建 user_sessions_archive 表（只有 service_role 可以访问）
+CREATE TABLE IF NOT EXISTS user_sessions_archive (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    fingerprint_hash VARCHAR(64) NOT NULL,
+    fingerprint_vector INTEGER[],
+    ip_address INET,
+    user_agent TEXT,
+    created_at TIMESTAMPTZ,
+    last_seen_at TIMESTAMPTZ,
+    kicked_reason TEXT,
+    similarity_score NUMERIC(5,2),
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_sessions_archive_user ON user_sessions_archive(user_id, created_at DESC);
+
+ALTER TABLE user_sessions_archive ENABLE ROW LEVEL SECURITY;
+
+-- 45. 让长时间没有心跳的会话失效，返回本批处理的行数（小于 p_limit 时表示已处理完）
+--     last_seen_at 由心跳批量写回（包括携带会话令牌的心跳，与 SESSION_TOKEN_TTL 无关），
+--     默认最多落后约 8 分钟（见 api/_lib/sessions.py），p_idle 应明显大于该值
+CREATE OR REPLACE FUNCTION expire_sessions(
+    p_idle INTERVAL DEFAULT INTERVAL '1 hour',
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    WITH expired AS (
+        SELECT s.id
+        FROM user_sessions s
+        WHERE s.is_active AND s.last_seen_at < NOW() - p_idle
+        ORDER BY s.last_seen_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), updated AS (
+        UPDATE user_sessions s
+        SET is_active = false, kicked_reason = 'expired'
+        FROM expired
+        WHERE s.id = expired.id
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM updated;
+$$;
+
+-- 46. 移走超过保留期的失效会话：p_purge 为 true 时直接删除，否则写入归档表
+--     对应的 fingerprint_bands 随会话级联删除
+CREATE OR REPLACE FUNCTION archive_sessions(
+    p_retention INTERVAL DEFAULT INTERVAL '90 days',
+    p_limit INTEGER DEFAULT 1000,
+    p_purge BOOLEAN DEFAULT false
+)
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    WITH old AS (
+        SELECT s.id
+        FROM user_sessions s
+        WHERE NOT s.is_active AND s.last_seen_at < NOW() - p_retention
+        ORDER BY s.last_seen_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM user_sessions s
+        USING old
+        WHERE s.id = old.id
+        RETURNING s.*
+    ), archived AS (
+        INSERT INTO user_sessions_archive (id, user_id, fingerprint_hash, fingerprint_vector, ip_address, user_agent,
+                                           created_at, last_seen_at, kicked_reason, similarity_score)
+        SELECT r.id, r.user_id, r.fingerprint_hash, r.fingerprint_vector, r.ip_address, r.user_agent,
+               r.created_at, r.last_seen_at, r.kicked_reason, r.similarity_score
+        FROM removed r
+        WHERE NOT p_purge
+        ON CONFLICT (id) DO NOTHING
+    )
+    SELECT count(*)::INTEGER FROM removed;
+$$;
+
+-- 47. 只允许服务端（service_role）调用
+REVOKE EXECUTE ON FUNCTION expire_sessions(INTERVAL, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION expire_sessions(INTERVAL, INTEGER) TO service_role;
+REVOKE EXECUTE ON FUNCTION archive_sessions(INTERVAL, INTEGER, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION archive_sessions(INTERVAL, INTEGER, BOOLEAN) TO service_role;
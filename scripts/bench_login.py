@@ -0,0 +1,211 @@
+"""
+登录延迟基准：用本地的 Supabase 桩服务（每次调用固定延迟）测量热实例中一次登录的耗时
+
+    python scripts/bench_login.py                          # 当前工作区
+    python scripts/bench_login.py --compare HEAD~1         # 与指定 git 版本对比（before / after）
+    python scripts/bench_login.py --delay 0.1 --runs 20
+
+桩服务在本进程中运行，对 Auth、PostgREST 表和 RPC 的每个请求先等待 --delay 秒再返回固定数据：
+账号存在、有一个指纹不同的在线会话，登录会走完异常记录、踢出旧会话、创建新会话的完整路径。
+每个版本在独立的子进程中导入 login handler，先登录一次预热（客户端、连接池），
+再连续登录 --runs 次，报告耗时中位数和数据库请求数。
+
+结果只反映请求的串行 / 并发结构（往返次数 × 延迟），不代表真实数据库的执行时间；
+需要安装 requirements.txt 中的依赖。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_cold_start import FAKE_KEY, REPO_ROOT, checkout
+
+USER_ID = "11111111-1111-1111-1111-111111111111"
+
+# 在子进程中执行：导入 login handler，用内存中的 socket 连续处理登录请求
+CHILD = r"""
+import importlib.util, io, json, statistics, sys, time
+
+root, runs = sys.argv[1], int(sys.argv[2])
+sys.path.insert(0, root)
+
+spec = importlib.util.spec_from_file_location("bench_login", root + "/api/auth/login.py")
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+
+
+class FakeSocket:
+    def __init__(self, data):
+        self.rfile = io.BytesIO(data)
+        self.sent = []
+
+    def makefile(self, mode, *args, **kwargs):
+        return self.rfile
+
+    def sendall(self, data):
+        self.sent.append(bytes(data))
+
+
+body = json.dumps({
+    "username": "bench",
+    "password": "bench-password",
+    "fingerprint_hash": "bench-new",
+    "fingerprint_raw": {"canvas_hash": "new", "platform": "Linux x86_64", "timezone": "Asia/Shanghai"},
+}).encode()
+request = b"POST /api/auth/login HTTP/1.0\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+
+samples = []
+for i in range(runs + 1):
+    sock = FakeSocket(request)
+    started = time.perf_counter()
+    module.handler(sock, ("127.0.0.1", 0), None)
+    elapsed = (time.perf_counter() - started) * 1000
+    status = int(b"".join(sock.sent).split(b" ", 2)[1])
+    if status != 200:
+        raise SystemExit(f"login returned {status}: {b''.join(sock.sent)[-200:]!r}")
+    if i:
+        samples.append(elapsed)
+
+print(json.dumps({"login_ms": statistics.median(samples), "min_ms": min(samples), "max_ms": max(samples)}))
+"""
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class StubSupabase(BaseHTTPRequestHandler):
+    """按路径返回固定数据的 Supabase 桩：覆盖各版本登录用到的 Auth、表和 RPC"""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.1
+    calls = 0
+    calls_lock = threading.Lock()
+
+    def handle_call(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with self.calls_lock:
+            type(self).calls += 1
+        time.sleep(self.delay)
+
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/auth/v1/token"):
+            result = {
+                "access_token": "bench.access.token", "token_type": "bearer", "expires_in": 3600,
+                "expires_at": int(time.time()) + 3600, "refresh_token": "bench-refresh",
+                "user": {"id": USER_ID, "aud": "authenticated", "app_metadata": {}, "user_metadata": {},
+                         "created_at": "2026-01-01T00:00:00Z", "email": "bench@internal.local"},
+            }
+        elif path.startswith("/rest/v1/rpc/"):
+            result = self.rpc(path.rsplit("/", 1)[-1])
+        elif path.startswith("/rest/v1/"):
+            result = self.table(path.rsplit("/", 1)[-1])
+            if "vnd.pgrst.object" in self.headers.get("Accept", ""):
+                result = result[0] if result else None
+        else:
+            result = {}
+
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def table(self, name):
+        if name == "user_profiles" and self.command == "GET":
+            return [{"user_id": USER_ID, "username": "bench", "account_status": "active",
+                     "risk_score": 0, "status_updated_at": None}]
+        if name == "user_sessions" and self.command == "GET":
+            return [self.session("bench-old", {"canvas_hash": "old", "platform": "MacIntel"})]
+        if self.command == "POST":
+            return [{"id": "bench-new", "user_id": USER_ID, "created_at": now()}]
+        return []
+
+    def rpc(self, name):
+        if name == "login_with_fingerprint":
+            return [{"result": "ok", "username": "bench", "account_status": "active", "risk_score": 15,
+                     "similarity_score": 0.2, "session_id": "bench-new", "session_created_at": now(),
+                     "status_version": 1, "shared_accounts": 0}]
+        if name == "recent_fingerprints":
+            return [self.session("bench-old", {"canvas_hash": "old", "platform": "MacIntel"})]
+        return []
+
+    @staticmethod
+    def session(session_id, fingerprint_raw):
+        return {"id": session_id, "user_id": USER_ID, "fingerprint_hash": session_id, "fingerprint_raw": fingerprint_raw,
+                "fingerprint_vector": None, "is_active": True, "last_seen_at": now(), "created_at": now()}
+
+    do_GET = do_POST = do_PATCH = do_DELETE = handle_call
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(root, url, runs):
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": url,
+        "SUPABASE_KEY": FAKE_KEY,
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_KEY,
+        "LOG_SAMPLE_RATE": "0",
+    })
+    StubSupabase.calls = 0
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, root, str(runs)],
+        capture_output=True, text=True, env=env, cwd=root,
+    )
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        return {"error": tail[0]}
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats["db_calls"] = StubSupabase.calls / (runs + 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure warm login latency against a fixed-delay Supabase stub")
+    parser.add_argument("--runs", type=int, default=10, help="timed logins after one warm-up (median is reported)")
+    parser.add_argument("--delay", type=float, default=0.1, help="stub latency per call in seconds")
+    parser.add_argument("--compare", metavar="REF", help="git revision to compare against (before)")
+    args = parser.parse_args()
+
+    StubSupabase.delay = args.delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSupabase)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    trees = []
+    tmpdir = None
+    if args.compare:
+        tmpdir = tempfile.TemporaryDirectory()
+        checkout(args.compare, tmpdir.name)
+        trees.append((f"before ({args.compare})", tmpdir.name))
+    trees.append(("after (working tree)" if args.compare else "working tree", REPO_ROOT))
+
+    print(f"stub delay {args.delay * 1000:.0f} ms per call, {args.runs} runs")
+    print(f"{'tree':<32} {'login_ms':>10} {'min_ms':>10} {'max_ms':>10} {'db_calls':>10}")
+    try:
+        for title, root in trees:
+            stats = measure(root, url, args.runs)
+            if "error" in stats:
+                print(f"{title:<32} error: {stats['error']}")
+                continue
+            print(f"{title:<32} {stats['login_ms']:>10.1f} {stats['min_ms']:>10.1f} "
+                  f"{stats['max_ms']:>10.1f} {stats['db_calls']:>10.1f}")
+    finally:
+        server.shutdown()
+        if tmpdir:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
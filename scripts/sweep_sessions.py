@@ -0,0 +1,209 @@
+"""
+会话清理：让停止心跳的会话失效，按保留策略归档或删除旧会话
+
+逐行处理的步骤都是分批调用数据库函数（见 database-user-profiles.sql 第 43-47 步），每批一个短事务，
+只锁住本批处理的行，登录和心跳可以照常进行。
+
+1. expire_sessions：超过 --idle-minutes 没有心跳的活跃会话置为失效（kicked_reason = 'expired'）
+2. 已按月分区时（执行过 database-sessions-partitioned.sql）：创建后续月份的分区，
+   整月都超过保留期的分区先在事务外分离（DETACH PARTITION），再归档并删除（drop_detached_sessions_partition）。
+   没有默认分区时使用 DETACH ... CONCURRENTLY，不阻塞读写；有默认分区时 PostgreSQL 只允许普通 DETACH，
+   会对 user_sessions 短暂加 ACCESS EXCLUSIVE 锁，排队等锁期间登录和心跳也会等待。
+   脚本为此设置 --lock-timeout-ms，拿不到锁时重试 --lock-retries 次后跳过该分区（下次运行再处理），
+   建议在低峰期运行（详见 database-sessions-partitioned.sql 开头的说明）
+3. archive_sessions：超过 --retention-days 的失效会话写入 user_sessions_archive（--purge 时直接删除）
+4. 已按月分区时：按同一保留期清理 fingerprint_bands
+
+    pip install "psycopg[binary]"
+    python scripts/sweep_sessions.py --dry-run
+    python scripts/sweep_sessions.py --idle-minutes 60 --retention-days 90
+    python scripts/sweep_sessions.py --purge --batch 5000 --sleep 0.2
+
+--dsn 默认读取环境变量 DATABASE_URL。可以用 cron 每小时运行一次；同时运行多个实例也是安全的（逐行加锁并跳过已锁定的行）。
+保留期不应短于 FINGERPRINT_HISTORY_DAYS（登录时比较的历史设备范围，默认 90 天）。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# 每次调用处理一批（参数：时间间隔、批大小 ...），返回本批处理的行数
+EXPIRE_QUERY = "SELECT expire_sessions(%s::interval, %s)"
+ARCHIVE_QUERY = "SELECT archive_sessions(%s::interval, %s, %s)"
+PURGE_BANDS_QUERY = "SELECT purge_fingerprint_bands(%s::interval, %s)"
+
+# 按月分区：过期分区列表、分离后归档并删除、是否存在默认分区（存在时不能使用 CONCURRENTLY）
+EXPIRED_PARTITIONS_QUERY = """
+    SELECT partition_name, attached, detach_pending, in_use FROM expired_user_sessions_partitions(%s::interval)
+"""
+DROP_DETACHED_QUERY = "SELECT drop_detached_sessions_partition(%s, %s)"
+HAS_DEFAULT_PARTITION_QUERY = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'user_sessions'::regclass AND partdefid <> 0)
+"""
+
+# lock_timeout 超时的 SQLSTATE
+LOCK_NOT_AVAILABLE = "55P03"
+
+# 预览：符合条件的行数
+COUNT_QUERIES = {
+    "expire": "SELECT count(*) FROM user_sessions WHERE is_active AND last_seen_at < NOW() - %s::interval",
+    "archive": "SELECT count(*) FROM user_sessions WHERE NOT is_active AND last_seen_at < NOW() - %s::interval",
+}
+
+
+def is_partitioned(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regprocedure('ensure_user_sessions_partitions(integer, timestamptz)') IS NOT NULL")
+        return cursor.fetchone()[0]
+
+
+def call_in_batches(conn, step, query, params, batch, sleep, max_batches):
+    """反复调用一批处理一次的函数，直到某一批不满（已处理完）或达到批数上限，返回处理的总行数"""
+    total = 0
+    for _ in range(max_batches):
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            count = cursor.fetchone()[0]
+        total += count
+        if count < batch:
+            break
+        print(f"{step}: {total}", file=sys.stderr)
+        if sleep:
+            time.sleep(sleep)
+    return total
+
+
+def detach_partition(conn, name, mode, lock_timeout_ms, retries, sleep):
+    """
+    在事务外分离一个分区（conn 为自动提交），成功返回 True；重试后仍拿不到锁返回 False
+    mode 为 concurrently、locking 或 finalize（上次 CONCURRENTLY 中断后完成分离）
+    """
+    suffixes = {"concurrently": " CONCURRENTLY", "locking": "", "finalize": " FINALIZE"}
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, false)", (f"{lock_timeout_ms}ms",))
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    # 分区名已由 expired_user_sessions_partitions 限定为 user_sessions_YYYYMM
+                    cursor.execute(f'ALTER TABLE user_sessions DETACH PARTITION "{name}"{suffixes[mode]}')
+                    return True
+                except Exception as e:
+                    if getattr(e, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                        raise
+                    print(f"detach {name}: lock not available (attempt {attempt + 1})", file=sys.stderr)
+                # CONCURRENTLY 在第二阶段超时时分区已标记为分离中，之后只能用 FINALIZE 完成
+                if mode == "concurrently":
+                    cursor.execute("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = %s::regclass", (name,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return True
+                    if row[0]:
+                        mode = "finalize"
+                time.sleep(max(sleep, 1.0))
+            return False
+        finally:
+            cursor.execute("RESET lock_timeout")
+
+
+def drop_partitions(conn, retention, purge, lock_timeout_ms, retries, sleep):
+    """分离并移除整月都超过保留期的分区，返回统计"""
+    with conn.cursor() as cursor:
+        cursor.execute(HAS_DEFAULT_PARTITION_QUERY)
+        mode = "locking" if cursor.fetchone()[0] else "concurrently"
+        cursor.execute(EXPIRED_PARTITIONS_QUERY, (retention,))
+        partitions = cursor.fetchall()
+
+    stats = {"detach_mode": mode, "partitions_dropped": [], "partitions_in_use": [],
+             "partitions_busy": [], "partition_rows_archived": 0}
+    for index, (name, attached, pending, in_use) in enumerate(partitions):
+        if attached and in_use and not pending:
+            stats["partitions_in_use"].append(name)
+            continue
+        if attached and not detach_partition(conn, name, "finalize" if pending else mode, lock_timeout_ms, retries, sleep):
+            # 拿不到锁时后面的分区大概率也一样；且同一张表同时只能有一个分离中的分区，剩下的留到下次运行
+            stats["partitions_busy"].extend(rest[0] for rest in partitions[index:] if not (rest[1] and rest[3] and not rest[2]))
+            break
+        with conn.cursor() as cursor:
+            cursor.execute(DROP_DETACHED_QUERY, (name, purge))
+            stats["partition_rows_archived"] += cursor.fetchone()[0]
+        stats["partitions_dropped"].append(name)
+    return stats
+
+
+def preview(conn, idle, retention):
+    result = {}
+    with conn.cursor() as cursor:
+        cursor.execute(COUNT_QUERIES["expire"], (idle,))
+        result["to_expire"] = cursor.fetchone()[0]
+        cursor.execute(COUNT_QUERIES["archive"], (retention,))
+        result["to_archive"] = cursor.fetchone()[0]
+    return result
+
+
+def sweep(conn, idle, retention, batch, purge=False, sleep=0.0, max_batches=1000, months_ahead=2,
+          lock_timeout_ms=500, lock_retries=3):
+    stats = {"partitioned": is_partitioned(conn)}
+
+    stats["expired"] = call_in_batches(conn, "expire", EXPIRE_QUERY, (idle, batch), batch, sleep, max_batches)
+
+    if stats["partitioned"]:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT ensure_user_sessions_partitions(%s)", (months_ahead,))
+            stats["partitions_created"] = cursor.fetchone()[0]
+        stats.update(drop_partitions(conn, retention, purge, lock_timeout_ms, lock_retries, sleep))
+
+    stats["purged" if purge else "archived"] = call_in_batches(
+        conn, "archive", ARCHIVE_QUERY, (retention, batch, purge), batch, sleep, max_batches
+    )
+
+    if stats["partitioned"]:
+        stats["bands_purged"] = call_in_batches(
+            conn, "purge_bands", PURGE_BANDS_QUERY, (retention, batch), batch, sleep, max_batches
+        )
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire idle sessions and archive or purge old ones")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Postgres connection string")
+    parser.add_argument("--idle-minutes", type=int, default=60, help="deactivate sessions without heartbeat for this long")
+    parser.add_argument("--retention-days", type=int, default=90, help="keep inactive sessions for this long")
+    parser.add_argument("--purge", action="store_true", help="delete old sessions instead of archiving them")
+    parser.add_argument("--batch", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--sleep", type=float, default=0.0, help="seconds to wait between batches")
+    parser.add_argument("--max-batches", type=int, default=1000, help="upper bound on batches per step")
+    parser.add_argument("--months-ahead", type=int, default=2, help="future monthly partitions to keep (partitioned schema)")
+    parser.add_argument("--lock-timeout-ms", type=int, default=500,
+                        help="lock_timeout for detaching a partition (partitioned schema)")
+    parser.add_argument("--lock-retries", type=int, default=3, help="retries when a partition detach times out")
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be processed")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+
+    try:
+        import psycopg
+    except ImportError:
+        parser.error('psycopg is required: pip install "psycopg[binary]"')
+
+    idle = f"{args.idle_minutes} minutes"
+    retention = f"{args.retention_days} days"
+    started = time.perf_counter()
+
+    # 自动提交：每批一个事务
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        if args.dry_run:
+            stats = preview(conn, idle, retention)
+        else:
+            stats = sweep(conn, idle, retention, args.batch, args.purge, args.sleep, args.max_batches, args.months_ahead,
+                          args.lock_timeout_ms, args.lock_retries)
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps({**stats, "dry_run": args.dry_run}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
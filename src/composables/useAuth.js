@@ -91,7 +91,8 @@ export function useAuth() {
             'Content-Type': 'application/json'
           },
           body: JSON.stringify({
-            session_id: session.value.id
+            session_id: session.value.id,
+            session_token: session.value.token
           })
         })
       }
@@ -133,16 +134,29 @@ export function useAuth() {
             'Content-Type': 'application/json'
           },
           body: JSON.stringify({
-            session_id: session.value.id
+            session_id: session.value.id,
+            session_token: session.value.token
           })
         })
 
         const result = await response.json()
+        const data = result.data || {}
 
-        // 如果账号被封禁，强制登出
-        if (result.force_logout) {
+        // 如果账号被封禁、会话已失效或令牌无效，强制登出
+        if (data.force_logout || response.status === 401) {
           await logout()
-          error.value = result.message || '您的账号已被限制访问'
+          error.value = data.message || result.error || '您的账号已被限制访问'
+          return
+        }
+
+        // 服务端轮换了会话令牌：保存新令牌，下次心跳使用
+        if (data.session_token) {
+          session.value = {
+            ...session.value,
+            token: data.session_token,
+            token_expires_at: data.token_expires_at
+          }
+          localStorage.setItem('auth_session', JSON.stringify(session.value))
         }
       } catch (err) {
         console.error('Heartbeat error:', err)
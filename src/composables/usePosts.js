@@ -1,18 +1,88 @@
 import { ref } from 'vue'
-import { getPosts } from '@/utils/api'
+import { getPosts, getPostChanges, API_BASE_URL } from '@/utils/api'
 import { ElMessage } from 'element-plus'
 
+// 每页条数：首屏只拉一小页，滚动到底部再继续加载
+const PAGE_SIZE = 20
+
+// 列表只需要摘要，全文在打开详情时按 id 获取
+const FEED_VIEW = 'summary'
+
+// 无法使用 SSE 时的增量轮询间隔
+const SYNC_INTERVAL = 60000
+
+// 首页数据的本地缓存（连同 ETag / Last-Modified 一起保存，用于条件请求）
+const FEED_CACHE_KEY = 'posts_feed_cache'
+
+const loadFeedCache = () => {
+  try {
+    const cached = JSON.parse(localStorage.getItem(FEED_CACHE_KEY) || 'null')
+    return cached && Array.isArray(cached.posts) ? cached : null
+  } catch {
+    localStorage.removeItem(FEED_CACHE_KEY)
+    return null
+  }
+}
+
+const saveFeedCache = (page) => {
+  try {
+    localStorage.setItem(FEED_CACHE_KEY, JSON.stringify({
+      posts: page.posts,
+      nextCursor: page.nextCursor,
+      watermark: page.watermark,
+      etag: page.etag,
+      lastModified: page.lastModified
+    }))
+  } catch {
+    // localStorage 不可用或已满时忽略，下次正常全量加载
+  }
+}
+
 export function usePosts() {
   const posts = ref([])
   const loading = ref(false)
+  const loadingMore = ref(false)
+  const hasMore = ref(false)
   const error = ref(null)
 
+  let nextCursor = null
+  // 增量同步水位线：首页响应给出，之后每次同步向前推进
+  let watermark = null
+  let syncing = false
+
+  // 实时更新：优先使用 SSE 推送，不支持时退回增量轮询
+  let eventSource = null
+  let syncTimer = null
+
   const fetchPosts = async () => {
-    loading.value = true
     error.value = null
+
+    // 先展示本地缓存，再带上校验信息向服务端确认是否有更新
+    const cached = loadFeedCache()
+    if (cached) {
+      posts.value = cached.posts
+      nextCursor = cached.nextCursor
+      watermark = cached.watermark || null
+      hasMore.value = !!nextCursor
+    } else {
+      loading.value = true
+    }
+
     try {
-      const data = await getPosts()
-      posts.value = data
+      const page = await getPosts({
+        limit: PAGE_SIZE,
+        view: FEED_VIEW,
+        etag: cached?.etag,
+        lastModified: cached?.lastModified
+      })
+
+      if (page.notModified) return
+
+      posts.value = page.posts
+      nextCursor = page.nextCursor
+      watermark = page.watermark
+      hasMore.value = !!nextCursor
+      saveFeedCache(page)
     } catch (err) {
       error.value = err.message
       ElMessage.error(`无法连接到服务器，请检查后端 API 是否正常运行。错误信息: ${err.message}`)
@@ -21,10 +91,135 @@ export function usePosts() {
     }
   }
 
+  /**
+   * 加载下一页（无限滚动）
+   */
+  const loadMore = async () => {
+    if (!hasMore.value || loading.value || loadingMore.value) return
+
+    loadingMore.value = true
+    try {
+      const page = await getPosts({ limit: PAGE_SIZE, cursor: nextCursor, view: FEED_VIEW })
+      const seen = new Set(posts.value.map(post => post.id))
+      posts.value = [...posts.value, ...page.posts.filter(post => !seen.has(post.id))]
+      nextCursor = page.nextCursor
+      hasMore.value = !!nextCursor
+    } catch (err) {
+      error.value = err.message
+      ElMessage.error(`加载更多失败: ${err.message}`)
+    } finally {
+      loadingMore.value = false
+    }
+  }
+
+  /**
+   * 把一批增量变更合并进当前列表
+   * 已加载的帖子原地更新；新帖子只在不早于已加载范围时插入，避免在列表中间出现断层
+   */
+  const applyChanges = (changes) => {
+    const removed = new Set(changes.tombstones.map(item => item.id))
+    const updated = new Map(changes.posts.map(post => [post.id, post]))
+    const oldest = posts.value.reduce(
+      (min, post) => (min === null || post.created_at < min ? post.created_at : min),
+      null
+    )
+
+    const merged = posts.value
+      .filter(post => !removed.has(post.id))
+      .map(post => {
+        const next = updated.get(post.id)
+        updated.delete(post.id)
+        return next || post
+      })
+
+    for (const post of updated.values()) {
+      if (!hasMore.value || oldest === null || post.created_at >= oldest) {
+        merged.push(post)
+      }
+    }
+
+    posts.value = merged
+  }
+
+  /**
+   * 增量同步：只拉取水位线之后变化的帖子（新增、修改、删除）
+   */
+  const syncPosts = async () => {
+    if (!watermark || syncing || loading.value) return
+
+    syncing = true
+    try {
+      let changes
+      do {
+        changes = await getPostChanges(watermark, { view: FEED_VIEW })
+        applyChanges(changes)
+        watermark = changes.watermark
+      } while (changes.hasMore)
+    } catch (err) {
+      // 同步失败不打扰用户，下次再试
+      console.error('Sync posts error:', err)
+    } finally {
+      syncing = false
+    }
+  }
+
+  /**
+   * 启动实时更新（需要在 fetchPosts 之后调用，以首页水位线作为起点）
+   */
+  const startLiveUpdates = () => {
+    stopLiveUpdates()
+
+    if (typeof window.EventSource !== 'function') {
+      startPolling()
+      return
+    }
+
+    const query = watermark ? `?since=${encodeURIComponent(watermark)}` : ''
+    eventSource = new EventSource(`${API_BASE_URL}/api/posts/stream${query}`)
+
+    // 事件 id 即水位线，浏览器断线重连时会自动通过 Last-Event-ID 带回
+    eventSource.addEventListener('post', (event) => {
+      applyChanges({ posts: [JSON.parse(event.data)], tombstones: [] })
+      watermark = event.lastEventId || watermark
+    })
+    eventSource.addEventListener('tombstone', (event) => {
+      applyChanges({ posts: [], tombstones: [JSON.parse(event.data)] })
+      watermark = event.lastEventId || watermark
+    })
+    eventSource.onerror = () => {
+      // 服务端不可用（例如返回 503）时浏览器不会再重连，改为轮询
+      if (eventSource?.readyState === EventSource.CLOSED) {
+        eventSource = null
+        startPolling()
+      }
+    }
+  }
+
+  const startPolling = () => {
+    syncTimer = setInterval(() => {
+      if (document.visibilityState === 'visible') {
+        syncPosts()
+      }
+    }, SYNC_INTERVAL)
+  }
+
+  const stopLiveUpdates = () => {
+    eventSource?.close()
+    eventSource = null
+    clearInterval(syncTimer)
+    syncTimer = null
+  }
+
   return {
     posts,
     loading,
+    loadingMore,
+    hasMore,
     error,
-    fetchPosts
+    fetchPosts,
+    loadMore,
+    syncPosts,
+    startLiveUpdates,
+    stopLiveUpdates
   }
 }
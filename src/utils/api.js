@@ -13,19 +13,111 @@ const apiClient = axios.create({
 })
 
 apiClient.interceptors.response.use(
-  response => response.data,
+  // rawResponse 为 true 时返回完整响应（需要读取响应头 / 状态码的场景）
+  response => (response.config.rawResponse ? response : response.data),
   error => {
     console.error('API Error:', error)
     return Promise.reject(error)
   }
 )
 
-export const getPosts = async () => {
-  const result = await apiClient.get('/api/posts')
+/**
+ * 获取帖子列表（游标分页，支持条件请求）
+ * @param {object} options
+ * @param {number} [options.limit] - 每页数量
+ * @param {string} [options.cursor] - 上一页返回的 next_cursor
+ * @param {string} [options.view] - 'summary' 时只返回摘要（excerpt / content_length / has_image），全文用 getPost 获取
+ * @param {string} [options.etag] - 上次响应的 ETag，用于 If-None-Match
+ * @param {string} [options.lastModified] - 上次响应的 Last-Modified，用于 If-Modified-Since
+ * @returns {Promise<{notModified: boolean, posts?: Array, nextCursor?: string|null, etag?: string|null, lastModified?: string|null}>}
+ */
+export const getPosts = async ({ limit, cursor, view, etag, lastModified } = {}) => {
+  const params = {}
+  if (limit) params.limit = limit
+  if (cursor) params.cursor = cursor
+  if (view) params.view = view
+
+  const headers = {}
+  if (etag) headers['If-None-Match'] = etag
+  if (lastModified) headers['If-Modified-Since'] = lastModified
+
+  const response = await apiClient.get('/api/posts', {
+    params,
+    headers,
+    rawResponse: true,
+    validateStatus: status => (status >= 200 && status < 300) || status === 304
+  })
+
+  // 内容未变化，继续使用本地缓存
+  if (response.status === 304) {
+    return { notModified: true }
+  }
+
+  const result = response.data
+  if (result.success && result.data) {
+    return {
+      notModified: false,
+      posts: result.data,
+      nextCursor: result.next_cursor || null,
+      watermark: result.watermark || null,
+      etag: response.headers.etag || null,
+      lastModified: response.headers['last-modified'] || null
+    }
+  }
+  throw new Error('数据格式错误')
+}
+
+/**
+ * 增量同步：获取水位线之后新增/修改/删除的帖子
+ * @param {string} since - 上一次响应中的 watermark
+ * @param {object} [options]
+ * @param {string} [options.view] - 与 getPosts 相同
+ * @returns {Promise<{posts: Array, tombstones: Array<{id: number, reason: string}>, watermark: string, hasMore: boolean}>}
+ */
+export const getPostChanges = async (since, { view } = {}) => {
+  const params = { since }
+  if (view) params.view = view
+  const result = await apiClient.get('/api/posts', { params })
+  if (result.success && result.data) {
+    return {
+      posts: result.data,
+      tombstones: result.tombstones || [],
+      watermark: result.watermark || since,
+      hasMore: !!result.has_more
+    }
+  }
+  throw new Error('数据格式错误')
+}
+
+/**
+ * 获取单条帖子全文（摘要列表打开详情时使用）
+ * @param {number} id - 帖子 id
+ * @returns {Promise<Object>}
+ */
+export const getPost = async (id) => {
+  const result = await apiClient.get(`/api/posts/${id}`)
   if (result.success && result.data) {
     return result.data
   }
   throw new Error('数据格式错误')
 }
 
+/**
+ * 全文搜索帖子（按相关度排序）
+ * @param {string} q - 关键词
+ * @param {Object} options
+ * @param {number} options.limit - 每页数量
+ * @param {string} options.cursor - 上一页返回的 nextCursor
+ * @returns {Promise<{posts: Array, nextCursor: string|null}>}
+ */
+export const searchPosts = async (q, { limit = 20, cursor } = {}) => {
+  const params = { q, limit }
+  if (cursor) params.cursor = cursor
+  const result = await apiClient.get('/api/posts/search', { params })
+  if (result.success && result.data) {
+    return { posts: result.data, nextCursor: result.next_cursor || null }
+  }
+  throw new Error('数据格式错误')
+}
+
 export { API_BASE_URL }